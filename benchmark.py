@@ -0,0 +1,365 @@
+"""
+Offline benchmarks for DriveDownload.
+
+Usage: python benchmark.py ranged [--size-mb 256] [--rate-mbps 20] [--parts 4]
+       python benchmark.py chunks [--size-mb 256] [--rate-mbps 10]
+       python benchmark.py startup [--runs 5]
+       python benchmark.py drive [--films 20] [--latency-ms 20] [--rate-mbps 50]
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import FileIO
+
+from googleapiclient.http import HttpRequest, MediaIoBaseDownload
+from httplib2 import Http
+
+from fakedrive import FakeDrive, serve as serve_drive
+from transfer import ChunkSizer, PartialFile, ranged_download
+
+
+class ThrottledHandler(BaseHTTPRequestHandler):
+    """
+    Serves server.payload with Range support, capping every
+    connection at server.rate bytes per second.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        payload = self.server.payload
+        start, end = 0, len(payload) - 1
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('range', ''))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2) or end), end)
+            self.send_response(206)
+            self.send_header('Content-Range',
+                             f'bytes {start}-{end}/{len(payload)}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+
+        block = 64 * 2**10
+        began = time.monotonic()
+        for offset in range(start, end + 1, block):
+            self.wfile.write(payload[offset:min(offset + block, end + 1)])
+            due = (offset - start + block) / self.server.rate
+            lag = due - (time.monotonic() - began)
+            if lag > 0:
+                time.sleep(lag)
+
+
+def serve(payload: bytes, rate: float) -> ThreadingHTTPServer:
+    """Start a throttled payload server on a free localhost port."""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ThrottledHandler)
+    server.payload = payload
+    server.rate = rate
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def serial(uri: str, file_name: str, size: int) -> bool:
+    """Current path: one MediaIoBaseDownload stream in 150 MB chunks."""
+    request = HttpRequest(Http(), lambda resp, content: content, uri)
+    with FileIO(file_name, 'wb') as fh:
+        downloader = MediaIoBaseDownload(fh, request,
+                                         chunksize=150 * 1024 * 1024)
+        complete = False
+        while not complete:
+            _, complete = downloader.next_chunk()
+    return os.path.getsize(file_name) == size
+
+
+def ranged(uri: str, file_name: str, size: int, parts: int,
+           block_size: int) -> bool:
+    """Split path: parts parallel Range streams."""
+    partial = PartialFile(file_name, {'id': 'bench', 'size': size})
+    complete = ranged_download(uri, partial, size,
+                               lambda: contextlib.nullcontext(Http()),
+                               parts=parts,
+                               block_size=block_size)
+    if complete:
+        partial.finish()
+    return complete
+
+
+def bench_ranged(args: argparse.Namespace) -> None:
+    size = args.size_mb * 2**20
+    payload = os.urandom(size)
+    server = serve(payload, args.rate_mbps * 2**20)
+    uri = f'http://127.0.0.1:{server.server_port}/file?alt=media'
+
+    with tempfile.TemporaryDirectory() as tmp:
+        runs = {
+            'serial': lambda name: serial(uri, name, size),
+            f'ranged x{args.parts}': lambda name: ranged(
+                uri, name, size, args.parts, args.block_mb * 2**20
+            ),
+        }
+        timings = {}
+        for label, run in runs.items():
+            name = os.path.join(tmp, label.replace(' ', '_'))
+            began = time.perf_counter()
+            ok = run(name)
+            timings[label] = time.perf_counter() - began
+            with open(name, 'rb') as f:
+                ok = ok and f.read() == payload
+            print(f"{label:>12}: {timings[label]:7.2f}s "
+                  f"{args.size_mb / timings[label]:8.2f} MB/s "
+                  f"{'ok' if ok else 'CORRUPT'}")
+    server.shutdown()
+    base = timings['serial']
+    for label, took in list(timings.items())[1:]:
+        print(f"speedup of {label}: {base / took:.2f}x")
+
+
+def chunk_child(args: argparse.Namespace) -> None:
+    """One serial download in a fresh process, fixed or adaptive chunks."""
+    request = HttpRequest(Http(), lambda resp, content: content, args.uri)
+    sizer = ChunkSizer(2**20, 150 * 2**20, 5)
+    began = time.perf_counter()
+    with tempfile.TemporaryFile() as tmp, FileIO(tmp.fileno(), 'wb',
+                                                 closefd=False) as fh:
+        downloader = MediaIoBaseDownload(fh, request,
+                                         chunksize=150 * 1024 * 1024)
+        complete, chunks = False, 0
+        while not complete:
+            before = downloader._progress
+            if args.child == 'adaptive':
+                downloader._chunksize = sizer.size
+            chunk_began = time.monotonic()
+            _, complete = downloader.next_chunk()
+            sizer.observe(downloader._progress - before,
+                          time.monotonic() - chunk_began)
+            chunks += 1
+    print(json.dumps({'seconds': time.perf_counter() - began,
+                      'chunks': chunks}))
+
+
+def bench_chunks(args: argparse.Namespace) -> None:
+    size = args.size_mb * 2**20
+    server = serve(os.urandom(size), args.rate_mbps * 2**20)
+    uri = f'http://127.0.0.1:{server.server_port}/file?alt=media'
+    for mode in ('fixed', 'adaptive'):
+        child = subprocess.Popen(
+            [sys.executable, __file__, 'chunks', '--child', mode,
+             '--uri', uri],
+            stdout=subprocess.PIPE,
+        )
+        out = child.stdout.read()
+        _, status, usage = os.wait4(child.pid, 0)
+        child.returncode = os.waitstatus_to_exitcode(status)
+        result = json.loads(out)
+        # ru_maxrss is in KB on Linux
+        print(f"{mode:>9}: {result['seconds']:7.2f}s "
+              f"{args.size_mb / result['seconds']:8.2f} MB/s "
+              f"{result['chunks']:4d} chunks "
+              f"peak RSS {usage.ru_maxrss / 1024:8.1f} MB")
+    server.shutdown()
+
+
+HEAVY_MODULES = ('pandas', 'googleapiclient.discovery', 'oauth2client')
+
+
+def bench_startup(args: argparse.Namespace) -> None:
+    here = os.path.dirname(os.path.abspath(__file__))
+    probe = ("import sys, downoptions; "
+             f"print(*[m for m in {HEAVY_MODULES!r} if m in sys.modules])")
+    commands = {
+        'driver.py --help': [sys.executable, 'driver.py', '--help'],
+        'import downoptions': [sys.executable, '-c', probe],
+    }
+    for label, command in commands.items():
+        timings = []
+        for _ in range(args.runs):
+            began = time.perf_counter()
+            done = subprocess.run(command, cwd=here, capture_output=True,
+                                  text=True, check=True)
+            timings.append(time.perf_counter() - began)
+        print(f"{label:>20}: best {min(timings) * 1000:7.1f} ms "
+              f"median {sorted(timings)[len(timings) // 2] * 1000:7.1f} ms")
+    print(f"heavy modules loaded by import: {done.stdout.strip() or 'none'}")
+
+    done = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                           'import downoptions'],
+                          cwd=here, capture_output=True, text=True, check=True)
+    rows = []
+    for line in done.stderr.splitlines()[1:]:
+        _, _, cumulative, name = (part.strip() for part in
+                                  line.replace(':', '|').split('|'))
+        rows.append((int(cumulative), name))
+    print("slowest imports (cumulative us):")
+    for cumulative, name in sorted(rows, reverse=True)[:args.top]:
+        print(f"{cumulative:>10}  {name}")
+
+
+SCENARIOS = ('FileDownload', 'FolderDownload', 'Custom')
+
+
+def drive_child(args: argparse.Namespace) -> None:
+    """One instruction file run by the Executor in a fresh process."""
+    # global_config parses sys.argv when imported
+    sys.argv = [sys.argv[0], '-c', args.config, '-s', args.setting]
+    from drive import API_CALLS
+    from executor import Executor
+    from global_config import instruction_set
+    from metrics import METRICS
+    from store import STORE
+
+    began = time.perf_counter()
+    results = Executor(instruction_set).run()
+    print()
+    print(json.dumps({
+        'seconds': time.perf_counter() - began,
+        'files': sum(result.done for result in results),
+        'failed': sum(result.total - result.done for result in results),
+        'bytes': METRICS.totals()['bytes'],
+        'api_calls': sum(API_CALLS.values()),
+        'saved': STORE.saved,
+    }))
+
+
+def drive_instructions(films: list, drive: FakeDrive, scenario: str) -> str:
+    """The instructions.ini line of scenario."""
+    if scenario == 'FileDownload':
+        names = [meta['name'] for meta in drive.files.values()
+                 if meta['name'].endswith(' - 0.mkv')]
+        return f"DOWNLOAD=FileDownload|{'^'.join(names)}|FileDownload|False"
+    if scenario == 'FolderDownload':
+        names = [meta['name'] for meta in drive.files.values()
+                 if re.search(r': No\. \d+ \(\d{4}\)$', meta['name'])]
+        return f"DOWNLOAD=FolderDownload|{'^'.join(names)}|FolderDownload|False"
+    directors = sorted({film.director for film in films})
+    return f"DOWNLOAD=Custom|{'^'.join(directors)}|.|director"
+
+
+def bench_drive(args: argparse.Namespace) -> None:
+    import pandas as pd
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    drive, films = FakeDrive.synthetic(args.films, args.files,
+                                       int(args.size_mb * 2**20), args.depth)
+    server = serve_drive(drive, args.latency_ms / 1000,
+                         args.rate_mbps * 2**20, args.error_rate)
+    with open(os.path.join(here, 'config', 'settings.json')) as f:
+        settings = json.load(f)
+
+    print(f"{'scenario':>15} {'files':>6} {'failed':>6} {'seconds':>8} "
+          f"{'files/s':>8} {'MB/s':>8} {'API/file':>8} {'HTTP':>6} "
+          f"{'peak RSS':>9} {'saved MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        database = os.path.join(tmp, 'films.xlsx')
+        pd.DataFrame(
+            [(film.title, film.director, film.year) for film in films],
+            columns=['Movie Name (Year)', 'Director', 'Year'],
+        ).to_excel(database, index=False)
+
+        for scenario in args.scenarios:
+            work = os.path.join(tmp, scenario)
+            os.makedirs(os.path.join(work, 'target'))
+            setting = os.path.join(work, 'settings.json')
+            config = os.path.join(work, 'instructions.ini')
+            with open(setting, 'w') as f:
+                json.dump({**settings,
+                           'BASE_TARGET': os.path.join(work, 'target'),
+                           'DATA_DIR': work,
+                           'DATABASE': database,
+                           'DRIVE_ENDPOINT': (
+                               f'http://127.0.0.1:{server.server_port}'
+                           ),
+                           'WORKERS': args.workers,
+                           'METRICS_JSONL': '',
+                           'METRICS_PROMETHEUS': ''}, f, indent='\t')
+            with open(config, 'w') as f:
+                f.write(drive_instructions(films, drive, scenario) + '\n')
+
+            server.stats.clear()
+            child = subprocess.Popen(
+                [sys.executable, __file__, 'drive', '--child',
+                 '--config', config, '--setting', setting],
+                cwd=here, stdout=subprocess.PIPE,
+                stderr=None if args.verbose else subprocess.DEVNULL,
+            )
+            out = child.stdout.read().decode()
+            _, status, usage = os.wait4(child.pid, 0)
+            if args.verbose:
+                print(out)
+            if os.waitstatus_to_exitcode(status):
+                print(f"{scenario:>15} failed, rerun with --verbose")
+                continue
+            result = json.loads(out.strip().splitlines()[-1])
+            seconds, files = result['seconds'], result['files']
+            # ru_maxrss is in KB on Linux
+            print(f"{scenario:>15} {files:6d} {result['failed']:6d} "
+                  f"{seconds:8.2f} {files / seconds:8.2f} "
+                  f"{result['bytes'] / 2**20 / seconds:8.2f} "
+                  f"{result['api_calls'] / max(1, files):8.2f} "
+                  f"{sum(server.stats[kind] for kind in server.stats if kind != 'bytes'):6d} "
+                  f"{usage.ru_maxrss / 1024:7.1f}MB "
+                  f"{result['saved'] / 2**20:8.2f}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest='bench', required=True)
+
+    ranged_parser = sub.add_parser('ranged', help='serial vs ranged single file')
+    ranged_parser.add_argument('--size-mb', type=int, default=256)
+    ranged_parser.add_argument('--rate-mbps', type=float, default=20,
+                               help='per-connection throttle of the local server')
+    ranged_parser.add_argument('--parts', type=int, default=4)
+    ranged_parser.add_argument('--block-mb', type=int, default=32)
+    ranged_parser.set_defaults(run=bench_ranged)
+
+    chunks_parser = sub.add_parser('chunks', help='fixed vs adaptive chunk size')
+    chunks_parser.add_argument('--size-mb', type=int, default=256)
+    chunks_parser.add_argument('--rate-mbps', type=float, default=10)
+    chunks_parser.add_argument('--child', choices=['fixed', 'adaptive'],
+                               help=argparse.SUPPRESS)
+    chunks_parser.add_argument('--uri', help=argparse.SUPPRESS)
+    chunks_parser.set_defaults(run=lambda args: (chunk_child if args.child
+                                                 else bench_chunks)(args))
+
+    startup_parser = sub.add_parser('startup', help='cold start and import time')
+    startup_parser.add_argument('--runs', type=int, default=5)
+    startup_parser.add_argument('--top', type=int, default=15)
+    startup_parser.set_defaults(run=bench_startup)
+
+    drive_parser = sub.add_parser('drive', help='whole downloaders against fakedrive')
+    drive_parser.add_argument('--films', type=int, default=20)
+    drive_parser.add_argument('--files', type=int, default=3,
+                              help='files per film folder')
+    drive_parser.add_argument('--size-mb', type=float, default=4,
+                              help='main file of a folder, the others are a tenth')
+    drive_parser.add_argument('--depth', type=int, default=2)
+    drive_parser.add_argument('--latency-ms', type=float, default=20)
+    drive_parser.add_argument('--rate-mbps', type=float, default=50,
+                              help='per-connection throttle of the fake server')
+    drive_parser.add_argument('--error-rate', type=float, default=0)
+    drive_parser.add_argument('--workers', type=int, default=4)
+    drive_parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS,
+                              default=list(SCENARIOS))
+    drive_parser.add_argument('--verbose', action='store_true')
+    drive_parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    drive_parser.add_argument('--config', help=argparse.SUPPRESS)
+    drive_parser.add_argument('--setting', help=argparse.SUPPRESS)
+    drive_parser.set_defaults(run=lambda args: (drive_child if args.child
+                                                else bench_drive)(args))
+
+    args = parser.parse_args()
+    args.run(args)
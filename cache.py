@@ -0,0 +1,109 @@
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+from global_config import (ABSPATH, CACHE_FILE, CACHE_MAX_ENTRIES,
+                           CACHE_TTL_HOURS, DATA_DIR)
+
+# __all__ = ['MetadataCache', 'CACHE']
+
+
+class MetadataCache:
+    """
+    On-disk cache of Drive metadata.
+    -----------------------------------------------------
+    args    -> path        => PathLike (sqlite file),
+            -> ttl         => float (seconds),
+            -> max_entries => int
+
+    -----------------------------------------------------
+    Entries are JSON values stored under (kind, key), e.g.
+    ('file', '<parent>/<name>') or ('children', folder_id).
+    Entries older than ttl are ignored and purged; past
+    max_entries the oldest are evicted. Every thread gets
+    its own sqlite connection.
+    """
+    _EVICT_EVERY = 256
+
+    def __init__(self, path: Path, ttl: float, max_entries: int):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS entries ('
+                ' kind TEXT, key TEXT, value TEXT, stored REAL,'
+                ' PRIMARY KEY (kind, key))'
+            )
+            db.execute('CREATE INDEX IF NOT EXISTS entries_stored'
+                       ' ON entries (stored)')
+
+    def _connect(self) -> sqlite3.Connection:
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30)
+            self._local.db = db
+        return db
+
+    def get(self, kind: str, key: str) -> Optional[Any]:
+        """Cached value, or None if missing or expired."""
+        row = self._connect().execute(
+            'SELECT value FROM entries WHERE kind = ? AND key = ?'
+            ' AND stored >= ?',
+            (kind, key, time.time() - self.ttl),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, kind: str, key: str, value: Any) -> None:
+        with self._connect() as db:
+            db.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)',
+                (kind, key, json.dumps(value), time.time()),
+            )
+        with self._lock:
+            self._puts += 1
+            evict = self._puts % self._EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> None:
+        """Drop expired entries, then the oldest beyond max_entries."""
+        with self._connect() as db:
+            db.execute('DELETE FROM entries WHERE stored < ?',
+                       (time.time() - self.ttl,))
+            db.execute(
+                'DELETE FROM entries WHERE rowid IN ('
+                ' SELECT rowid FROM entries ORDER BY stored DESC'
+                ' LIMIT -1 OFFSET ?)',
+                (self.max_entries,),
+            )
+
+    def invalidate(self, kind: str = None, key: str = None) -> int:
+        """
+        Forget entries; everything when called without args.
+        Returns the number of entries removed.
+        """
+        query, params = 'DELETE FROM entries', []
+        if kind is not None:
+            query += ' WHERE kind = ?'
+            params.append(kind)
+            if key is not None:
+                query += ' AND key = ?'
+                params.append(key)
+        with self._connect() as db:
+            return db.execute(query, params).rowcount
+
+
+CACHE = MetadataCache(
+    ABSPATH / DATA_DIR / CACHE_FILE,
+    CACHE_TTL_HOURS * 3600,
+    CACHE_MAX_ENTRIES,
+)
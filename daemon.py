@@ -0,0 +1,262 @@
+"""
+Run DriveDownload as a long-lived daemon.
+
+Usage: python daemon.py [-c instructions.ini] [-s settings.json]
+
+New DOWNLOAD= lines appended to the instruction file, and
+instruction files dropped into config/<DAEMON_SPOOL>, are
+queued as soon as they are seen. Progress goes to
+data/<DAEMON_STATUS_FILE> and, with DAEMON_STATUS_PORT set,
+to http://127.0.0.1:<port>/status.
+"""
+
+import json
+import os
+import queue
+import signal
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Optional
+
+from cache import CACHE
+from downoptions import BaseDownloader
+from drive import API_CALLS
+from engine import DownloadEngine
+from executor import Executor, InstructionResult, label_of
+from global_config import (ABSPATH, CONFIG, CONFIG_DIR, DAEMON_POLL_SECONDS,
+                           DAEMON_SPOOL, DAEMON_STATUS_FILE,
+                           DAEMON_STATUS_PORT, DATA_DIR, INSTRUCTION_WORKERS,
+                           INVALIDATE_CACHE, Instruction, parse_instruction)
+from metrics import METRICS
+from store import STORE
+from throttle import reload_limit
+from utils import say
+
+# __all__ = ['Daemon']
+
+
+class Daemon:
+    """
+    Watches for instructions and runs them on warm connections.
+    -----------------------------------------------------
+    args    -> config      => Path (instruction file to watch),
+            -> spool       => Path (directory of instruction files),
+            -> status_file => Path,
+            -> poll        => float (seconds between checks),
+            -> workers     => int (instructions run at once)
+
+    -----------------------------------------------------
+    One DownloadEngine pool and one planning pool live as
+    long as the daemon, so the pooled keep-alive
+    connections, along with the credentials, discovery
+    document, FilmDB and metadata cache, are built once.
+    Lines already in config when the daemon starts are
+    queued too; the Ledger skips what they already
+    downloaded.
+    A spool file is read whole, then moved to spool/done.
+    """
+
+    def __init__(
+        self,
+        config: Path = CONFIG,
+        spool: Path = ABSPATH / CONFIG_DIR / DAEMON_SPOOL,
+        status_file: Path = ABSPATH / DATA_DIR / DAEMON_STATUS_FILE,
+        poll: float = DAEMON_POLL_SECONDS,
+        workers: int = INSTRUCTION_WORKERS
+    ):
+        self.config = Path(config)
+        self.spool = Path(spool)
+        self.status_file = Path(status_file)
+        self.poll = poll
+        self.workers = max(1, int(workers))
+        self.engine = DownloadEngine(
+            BaseDownloader._download_job,
+            BaseDownloader.check_success,
+            BaseDownloader.write_success,
+        )
+        self.planner = ThreadPoolExecutor(self.workers,
+                                          thread_name_prefix='plan')
+        self.queue = queue.Queue()
+        self.running = Counter()
+        self.results = deque(maxlen=100)
+        self.started = time.time()
+        self._seen = Counter()
+        self._mtime = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _parse(lines: list[str], source: str) -> list[Instruction]:
+        instructions = []
+        for line in lines:
+            try:
+                instr = parse_instruction(line)
+            except (OSError, ValueError, SyntaxError, TypeError) as e:
+                print(f"{source}: skipping {line.strip()!r}: {e}")
+                continue
+            if instr is not None:
+                instructions.append(instr)
+        return instructions
+
+    def _read_config(self) -> list[Instruction]:
+        """Lines of self.config not seen before."""
+        try:
+            mtime = self.config.stat().st_mtime_ns
+        except OSError:
+            return []
+        if mtime == self._mtime:
+            return []
+        self._mtime = mtime
+        with open(self.config, encoding='utf-8') as f:
+            lines = [line.strip() for line in f]
+        counts, fresh = Counter(), []
+        for line in lines:
+            counts[line] += 1
+            if counts[line] > self._seen[line]:
+                fresh.append(line)
+        self._seen |= counts
+        return self._parse(fresh, self.config.name)
+
+    def _read_spool(self) -> list[Instruction]:
+        """Every instruction of the files waiting in self.spool."""
+        if not self.spool.is_dir():
+            return []
+        done = self.spool / 'done'
+        instructions = []
+        for path in sorted(self.spool.glob('*.ini')):
+            with open(path, encoding='utf-8') as f:
+                instructions += self._parse(f.readlines(), path.name)
+            done.mkdir(exist_ok=True)
+            os.replace(path, done / path.name)
+        return instructions
+
+    def _consume(self) -> None:
+        while not self._stop.is_set():
+            try:
+                instr = self.queue.get(timeout=self.poll)
+            except queue.Empty:
+                continue
+            label = label_of(instr)
+            with self._lock:
+                self.running[label] += 1
+            try:
+                results = Executor([instr], engine=self.engine,
+                                   planner=self.planner).run()
+            except KeyboardInterrupt:
+                # the engine was cancelled, the daemon is stopping
+                return
+            except Exception as e:
+                results = [InstructionResult(label, False, 0, 0,
+                                             API_CALLS[label],
+                                             f"{type(e).__name__}: {e}")]
+            finally:
+                with self._lock:
+                    self.running[label] -= 1
+                    if not self.running[label]:
+                        del self.running[label]
+                self.queue.task_done()
+            for result in results:
+                say(result)
+                with self._lock:
+                    self.results.append(result)
+
+    def status(self) -> dict:
+        """Queue depth, running instructions and active transfers."""
+        with self._lock:
+            running = list(self.running.elements())
+            results = list(self.results)
+        return {
+            'pid': os.getpid(),
+            'started': self.started,
+            'updated': time.time(),
+            'queued': self.queue.qsize(),
+            'running': running,
+            'transfers': METRICS.transfers(),
+            'totals': METRICS.totals(),
+            'saved_bytes': STORE.saved,
+            'results': [result._asdict() for result in results],
+        }
+
+    def _write_status(self) -> None:
+        """Write status() atomically; a failure is only logged."""
+        try:
+            self.status_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.status_file.with_suffix('.tmp')
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self.status(), f, indent='\t')
+            os.replace(tmp, self.status_file)
+        except (OSError, RuntimeError, TypeError, ValueError) as e:
+            print(f"{self.status_file.name}: {type(e).__name__}: {e}")
+
+    def serve_status(self, port: int) -> ThreadingHTTPServer:
+        """Serve status() as JSON on 127.0.0.1:port."""
+        daemon = self
+
+        class StatusHandler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.rstrip('/') not in ('', '/status'):
+                    self.send_error(404)
+                    return
+                data = json.dumps(daemon.status()).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        server = ThreadingHTTPServer(('127.0.0.1', port), StatusHandler)
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def stop(self, *_) -> None:
+        self._stop.set()
+
+    def run(self, status_port: Optional[int] = DAEMON_STATUS_PORT) -> None:
+        """Watch and run instructions until stop() is called."""
+        self.engine.start()
+        consumers = [threading.Thread(target=self._consume, daemon=True,
+                                      name=f'instruction-{n}')
+                     for n in range(self.workers)]
+        for consumer in consumers:
+            consumer.start()
+        server = self.serve_status(status_port) if status_port else None
+        print(f"Watching {self.config} and {self.spool}")
+        try:
+            while not self._stop.is_set():
+                for instr in self._read_config() + self._read_spool():
+                    print(f"Queued {label_of(instr)}")
+                    self.queue.put(instr)
+                self._write_status()
+                self._stop.wait(self.poll)
+        finally:
+            self.engine.cancel.set()
+            self.engine.close()
+            self.planner.shutdown(wait=True, cancel_futures=True)
+            for consumer in consumers:
+                consumer.join()
+            if server is not None:
+                server.shutdown()
+            self._write_status()
+            for path in self.engine.incomplete():
+                print(f"{Path(path).name} is incomplete, kept as .part.")
+
+
+if __name__ == '__main__':
+    if INVALIDATE_CACHE:
+        print(f"Dropped {CACHE.invalidate()} cached Drive entries.")
+        raise SystemExit(0)
+
+    daemon = Daemon()
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, reload_limit)
+    signal.signal(signal.SIGTERM, daemon.stop)
+    signal.signal(signal.SIGINT, daemon.stop)
+    daemon.run()
@@ -1,14 +1,40 @@
 from global_config import *
+import pickle
+import re
 import shutil
+import threading
 from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseDownload
+from io import FileIO
 from pathlib import Path
 from os.path import join as pjoin
-import pandas as pd
 from utils import *
-from typing import Union
+from cache import CACHE
+from drive import (FOLDER_MIME, INSTRUCTION, MEDIA_POOL, META_FIELDS,
+                   execute, get_drive)
+from matching import FolderIndex, folder_inventory
+from resolve import _quote, resolve_names
+from tree import list_children, walk_all
+from transfer import (ChunkSizer, MemoryBudget, PartialFile,
+                      ranged_download, split_ranges)
+from engine import DownloadEngine, Job
+from governor import GOVERNOR
+from instrument import INSTRUMENTS
+from ledger import Ledger
+from metrics import METRICS
+from store import STORE
+from throttle import BANDWIDTH, PRIORITY
+from verify import HashingFileIO, find_identical, md5_file, sha256_file
+from typing import TYPE_CHECKING, Union
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 # __all__ = ['FilmDB', 'FileDownload', 'FolderDownload', 'Custom']
 
+CHUNK_BUDGET = MemoryBudget(CHUNK_MEMORY_MB * 2**20)
+WORKSPACE_MIME = 'application/vnd.google-apps.'
+
 class FilmDB:
     """
     Searches for film via different queries.
@@ -17,28 +43,113 @@ class FilmDB:
         '_filename': 'full path of database file',
         '_db': 'Dataframe of film information',
         'columns': 'Column names of the database',
-        '_file_without_path': 'database filename without path'
+        '_file_without_path': 'database filename without path',
+        '_folded': 'casefolded text columns, by column name',
+        '_directors': '(casefolded director, film) rows sorted by year',
+        '_by_director': 'casefolded director -> films sorted by year',
+        '_stamp': '(mtime_ns, size) of the xlsx the data was built from'
     }
 
+    _loaded = {}
+    _loaded_lock = threading.Lock()
+
     def __init__(self, filename: str=DATABASE):
         self._filename = (
-            HOME / DATA_DIR / filename
+            Path(HOME) / DATA_DIR / filename
             if not Path(filename).is_file()
             else Path(filename)
         )
-        self._db = pd.read_excel(self._filename)
-        self.columns = [col for col in self._db.columns
-                        if not col.startswith('Unnamed')]
-        self._db = self._db[self.columns]
-        self._db = self._db[self._db[self.columns[0]].notnull()]
         self._file_without_path = self._filename.name
+        data = self._load()
+        self._db = data['db']
+        self._folded = data['folded']
+        self._directors = data['directors']
+        self._by_director = dict(data['by_director'])
+        self.columns = list(self._db.columns)
+
+    @classmethod
+    def load(cls, filename: str=DATABASE) -> "FilmDB":
+        """
+        Shared FilmDB of filename, rebuilt when the xlsx
+        has changed since, so a long-running daemon sees
+        edits to it.
+        """
+        with cls._loaded_lock:
+            filmdb = cls._loaded.get(filename)
+            if filmdb is None or filmdb._stamp != filmdb._current_stamp():
+                filmdb = cls._loaded[filename] = cls(filename)
+            return filmdb
+
+    def _current_stamp(self) -> tuple:
+        stat = self._filename.stat()
+        return stat.st_mtime_ns, stat.st_size
+
+    def _cache_file(self) -> Path:
+        return self._filename.with_name(f'.{self._filename.stem}.pkl')
+
+    def _load(self) -> dict:
+        """
+        Indexed data of the database, from the pickled cache
+        next to it unless the xlsx changed since.
+        -----------------------------------------------
+        The cache is trusted while the xlsx keeps its mtime
+        and size; if those moved but the sha256 did not,
+        only the stamp is refreshed.
+        """
+        stamp = self._stamp = self._current_stamp()
+        digest = None
+        try:
+            with open(self._cache_file(), 'rb') as f:
+                cached = pickle.load(f)
+            if cached['stamp'] == stamp:
+                return cached['data']
+            digest = sha256_file(self._filename)
+            if cached['sha256'] == digest:
+                self._store(stamp, digest, cached['data'])
+                return cached['data']
+        except Exception:
+            # missing, corrupt or written by another pandas version
+            pass
+        data = self._build()
+        self._store(stamp, digest or sha256_file(self._filename), data)
+        return data
+
+    def _store(self, stamp: tuple, digest: str, data: dict) -> None:
+        tmp = self._cache_file().with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            pickle.dump({'stamp': stamp, 'sha256': digest, 'data': data},
+                        f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._cache_file())
+
+    def _build(self) -> dict:
+        import pandas as pd
+
+        db = pd.read_excel(self._filename)
+        columns = [col for col in db.columns
+                   if not col.startswith('Unnamed')]
+        db = db[columns]
+        db = db[db[columns[0]].notnull()]
+        folded = {col: db[col].str.casefold() for col in columns
+                  if db[col].dtype == object}
+
+        films = db[db['Director'].notna()].sort_values(by='Year')
+        directors = list(zip(films['Director'].str.casefold(),
+                             films['Movie Name (Year)']))
+        by_director = {}
+        for director, film in directors:
+            names = {director, *(name.strip() for name
+                                 in re.split(r',|&| and ', director))}
+            for name in names - {''}:
+                by_director.setdefault(name, []).append(film)
+        return {'db': db, 'folded': folded, 'directors': directors,
+                'by_director': by_director}
 
     def search(
         self,
         term: str, 
         director: bool=False, 
         case: bool=False
-    ) -> pd.Series:
+    ) -> "pd.Series":
        """
        Search films in database.
        If director==True, get i-th column where i==1
@@ -51,9 +162,10 @@ class FilmDB:
        returns   -> entries that have matching term => pd.Series
        """
 
-       s = self._db[self.columns[director]]
+       column = self.columns[director]
+       s = self._db[column]
        if case == False:
-            s = s.str.casefold()
+            s = self._folded.get(column, s)
             term = term.casefold()
        return self._db[s.str.contains(term)]
 
@@ -70,7 +182,10 @@ class FilmDB:
 
         -----------------------------------------------
         provided by=='director' and name==<some_name>,
-        return list of films by that director from the db.
+        return list of films by that director from the db,
+        oldest first. A full director name is a dict lookup;
+        anything else falls back to a substring match over
+        the directors once and is then remembered.
         """
 
         if not by == 'director':
@@ -78,17 +193,14 @@ class FilmDB:
                     "Only 'director' is supported argument for keyword 'by'"
                 )
 
-        director = kwargs.get('name').lower()
+        director = kwargs.get('name', '').casefold()
         if director:
-            self._db = self._db[self._db['Director'].notna()]
-            films = (
-                self._db[self._db['Director']
-                .str.contains(director)]
-                .sort_values(by='Year')['Movie Name (Year)']
-                .tolist()
-            )
-
-            return films
+            films = self._by_director.get(director)
+            if films is None:
+                films = [film for name, film in self._directors
+                         if director in name]
+                self._by_director[director] = films
+            return list(films)
         else:
             raise NotImplementedError
 
@@ -131,88 +243,119 @@ class BaseDownloader:
         self.target = None
         self.special = None
         self.tot_folders = None
- #       self.last_updated_file = None
+        self.engine = DownloadEngine(
+            self._download_job, self.check_success, self.write_success
+        )
 
     @staticmethod
-    def get_file_id(file_name: str, parent=None) -> str:
+    def get_file(file_name: str, parent=None) -> dict:
         """
-        Add docstrings
+        Metadata (META_FIELDS) of the file called file_name,
+        narrowed down to parent's children when the name is
+        not unique. Served from the metadata cache when fresh.
         """
-        query = ["mimeType != 'application/vnd.google-apps.folder'",
-                  f"name = '{file_name}'"]
-        query = ' and '.join(query)
-        file_name = file_name.replace("'", "\\'")
-        query = f"name = '{file_name}'"
-        files = DRIVE.files().list(q=query,
-                                    corpora='user'
-                                    ).execute().get('files', [])
+        key = f"{parent or ''}/{file_name}"
+        meta = CACHE.get('file', key)
+        if meta is None:
+            meta = BaseDownloader._get_file(file_name, parent)
+            CACHE.put('file', key, meta)
+        return meta
+
+    @staticmethod
+    def _get_file(file_name: str, parent=None) -> dict:
+        query = f"name = '{_quote(file_name)}'"
+        files = execute(get_drive().files().list(q=query,
+                                    corpora='user',
+                                    fields=f'files({META_FIELDS})'
+                                    )).get('files', [])
         if not files:
             raise FileNotFoundError(2, "No such file or directory", file_name)
         elif len(files) > 1:
             if not parent:
-                return files[0]['id']
+                return files[0]
                 raise ValueError("More than one value found", files)
             else:
-                file_name = parent.replace("'", "\\'")
-                query += f' and "{parent}" in parents'
-                files = DRIVE.files().list(q=query, 
-                                            corpora='user'
-                                            ).execute().get('files', [])
+                query += f" and '{parent}' in parents"
+                files = execute(get_drive().files().list(q=query,
+                                            corpora='user',
+                                            fields=f'files({META_FIELDS})'
+                                            )).get('files', [])
                 if len(files) > 1:
                     raise ValueError("More than one value found", files)
                 else:
-                    return files[0]['id']
+                    return files[0]
         else:
-            return files[0]['id']
+            return files[0]
 
-    def download(self):
+    @staticmethod
+    def get_file_id(file_name: str, parent=None) -> str:
         """
-        Base download method.
+        Id of the file called file_name, see get_file.
         """
-        query = [
-            "mimeType != 'application/vnd.google-apps.folder'",
-            f"name = '{file_name}'"
-            ]
-        query = ' and '.join(query)
-        file_name = file_name.replace("'", "\\'").replace("\\", r'\\')
-        query = f"name contains '{file_name}'"
-        files = DRIVE.files().list(q=query, 
-                                    corpora='user'
-                                    ).execute().get('files', [])
+        return BaseDownloader.get_file(file_name, parent)['id']
 
-        if not files:
-            raise FileNotFoundError(2, "No such file or directory", file_name)
-        elif len(files) > 1:
-            if not parent:
-                return files[0]['id']
-                raise ValueError("More than one value found", files)
-            else:
-                query += f' and "{parent}" in parents'
-                files = DRIVE.files().list(q=query, 
-                                            corpora='user'
-                                            ).execute().get('files', [])
-                if len(files) > 1:
-                    raise ValueError("More than one value found", files)
-                else:
-                    return files[0]['id']
-        else:
-            return files[0]['id']
+    def jobs(self) -> list[Job]:
+        """
+        Resolve what to download into a list of Jobs.
+        """
+        raise NotImplementedError
+
+    def download(self) -> dict[str, bool]:
+        """
+        Download every job of this downloader through the engine.
+        Files already on disk with the remote size and checksum
+        are recorded as done instead of being downloaded again.
+        """
+        jobs = self.jobs()
+        self.skip_identical(jobs)
+        return self.engine.run(jobs)
 
     @staticmethod
-    def write_success(fullpath: str, filename: str) -> None:
+    def skip_identical(jobs: list[Job]) -> None:
         '''
-        Write filename at fullpath in 'success.txt'.
+        Record jobs whose destination already holds the remote
+        file as successful, so the engine skips them.
         '''
-        with open(pjoin(fullpath, 'success.txt'), 'a+') as f:
-            f.write(filename + '\n')
+        pending = [job for job in jobs
+                   if not BaseDownloader.check_success(job.fullpath, job.name)]
+        for job in find_identical(pending):
+            say(f"{job.name} already present (checksum match)")
+            BaseDownloader.write_success(job.fullpath, job.name, job.meta)
+
+    @staticmethod
+    def _download_job(
+        job: Job,
+        cancel: threading.Event,
+        progress: bool
+    ) -> bool:
+        INSTRUCTION.set(job.instruction)
+        PRIORITY.set(job.priority)
+        return BaseDownloader.download_file(
+            job.file_id, job.path, cancel, progress, job.meta
+        )
+
+    @staticmethod
+    def write_success(fullpath: str, filename: str, meta: dict = None) -> None:
+        '''
+        Record filename as downloaded in fullpath's Ledger,
+        with size and md5Checksum when meta has them, and
+        index it in the content STORE.
+        Safe to call from several download workers.
+        '''
+        meta = meta or {}
+        size = meta.get('size')
+        Ledger.for_dir(fullpath).record(
+            filename,
+            int(size) if size is not None else None,
+            meta.get('md5Checksum'),
+        )
+        STORE.add(meta, pjoin(fullpath, filename))
 
 
     @staticmethod
     def check_success(path: str, file_name: str) -> bool:
         '''
-        Check if success.txt exists in path, and file_name 
-        exists in success.txt, if both True return True, 
-        else False
+        Check if file_name is recorded in the Ledger of path.
         ----------------------------------------------------
         args      -> path      => str,
                   -> file_name => str
@@ -220,34 +363,57 @@ class BaseDownloader:
         returns   -> success   => bool
 
         ----------------------------------------------------
+        The ledger is loaded once per directory (migrating an
+        old success.txt), every later check is a dict lookup
+        on the exact name.
         '''
-        if 'success.txt' in os.listdir(path):
-            return file_name in open(
-                    pjoin(path, 'success.txt')
-                    ).read()
-        return False
+        with INSTRUMENTS.timer('ledger.check'):
+            return file_name in Ledger.for_dir(path)
 
 
     @staticmethod
-    def download_file(file_id: str, file_name: str) -> bool:
+    def download_file(
+        file_id: str,
+        file_name: str,
+        cancel: threading.Event = None,
+        progress: bool = True,
+        meta: dict = None
+    ) -> bool:
         '''
         Download files given file_id and save it in filename
         ------------------------------------------------------
         args      -> file_id   => str,
-                  -> file_name => str
+                  -> file_name => str,
+                  -> cancel    => threading.Event / None,
+                  -> progress  => bool (default: True),
+                  -> meta      => dict / None (listing metadata)
         
         returns   -> complete  => bool
 
         ------------------------------------------------------
-        complete==True if file download successful else False
+        complete==True if file download successful else False.
+        Resumable through a transfer.PartialFile, split into
+        ranged_download streams above SPLIT_THRESHOLD_MB, and
+        only complete when the data matches md5Checksum.
+        meta comes from listings cached for CACHE_TTL_HOURS,
+        so it is refreshed here, in place for the Ledger.
+        Stops with KeyboardInterrupt once cancel is set.
         '''
 
-        total_size_bytes = total_size = int(
-            DRIVE.files()
-            .get(fileId=file_id, fields='size')
-            .execute()
-            .get('size')
+        drive = get_drive()
+        fresh = execute(
+            drive.files()
+            .get(fileId=file_id, fields=META_FIELDS)
         )
+        if meta is None:
+            meta = fresh
+        else:
+            meta.update(fresh)
+        if meta['mimeType'].startswith(WORKSPACE_MIME):
+            return BaseDownloader.export_file(
+                file_id, file_name, meta['mimeType'], cancel, progress
+            )
+        total_size_bytes = total_size = int(meta.get('size'))
         unit = 'bytes'
 
         if total_size // 2**30:
@@ -260,44 +426,173 @@ class BaseDownloader:
             total_size /= 2**10
             unit = 'KB'
 
-        print(f'Size: {total_size:.2f} {unit}')
-        request = DRIVE.files().get_media(fileId=file_id)
-        fh = FileIO(file_name, 'wb')
-        downloader = MediaIoBaseDownload(fh,
-                                        request,
-                                        chunksize=150 * 1024 * 1024)
-        complete = False
-        start_time = time.time()
-        plausible_error = (
-            "Only files with binary content can be downloaded. "
-            "Use Export with Google Docs files."
-            )
-
-        try:
-            if total_size_bytes > 10 * 2**20: print('Starting ...')
-            while complete is False:
-                status, complete = downloader.next_chunk()
-                print('\r', end= download_info(status, start_time))
-        except HttpError as e:
-            if plausible_error in str(e):
-                print(
-                    'Probabale Doc/Sheet file. '
-                    'switching to Doc mode.'
+        say(f'{Path(file_name).name}: Size: {total_size:.2f} {unit}')
+        request = drive.files().get_media(fileId=file_id)
+        partial = PartialFile(file_name, meta, FSYNC)
+        parts = (SPLIT_PARTS if total_size_bytes >= SPLIT_THRESHOLD_MB * 2**20
+                 else 1)
+        spans = partial.spans(split_ranges(total_size_bytes, parts))
+        if partial.received(spans):
+            say(f'Resuming {Path(file_name).name} at '
+                f'{bytes_to_MB(partial.received(spans)):.2f} MB')
+
+        priority = PRIORITY.get()
+        with METRICS.start(Path(file_name).name, total_size_bytes,
+                           partial.received(spans), progress) as transfer:
+            if len(spans) > 1:
+                if progress: say(f'Starting {len(spans)} ranged streams ...')
+                complete = ranged_download(
+                    request.uri, partial, total_size_bytes,
+                    MEDIA_POOL.connection,
+                    parts=parts,
+                    block_size=SPLIT_BLOCK_MB * 2**20,
+                    cancel=cancel,
+                    progress=lambda status: transfer.update(
+                        status.resumable_progress
+                    ),
+                    throttle=lambda nbytes: BANDWIDTH.consume(nbytes, priority),
+                    budget=CHUNK_BUDGET,
+                    retry=GOVERNOR.call,
+                )
+                if not complete:
+                    return False
+                return transfer.finish(
+                    BaseDownloader._finish(partial, meta, md5_file(partial.path))
                 )
-                mimeType=('application/'
-                            'vnd.openxmlformats-officedocument'
-                            '.spreadsheetml.sheet'
-                            )
-                request = DRIVE.files().export_media(
-                    fileId=file_id, 
-                    mimeType=mimeType,
+
+            (_, end, offset), = spans or [[0, -1, 0]]
+            fh = HashingFileIO(partial.open(), 'r+b', offset)
+            # MediaIoBaseDownload sends every chunk on request.http
+            http = request.http = MEDIA_POOL.checkout()
+            broken = True
+            sizer = ChunkSizer(CHUNK_MIN_MB * 2**20,
+                               min(CHUNK_MAX_MB, CHUNK_MEMORY_MB) * 2**20,
+                               CHUNK_TARGET_SECONDS)
+            downloader = MediaIoBaseDownload(fh,
+                                            request,
+                                            chunksize=sizer.size)
+            # MediaIoBaseDownload builds its Range header from _progress,
+            # there is no public way to start it mid-file.
+            downloader._progress = offset
+            complete = bool(spans) and offset > end
+
+            def next_chunk() -> tuple:
+                with INSTRUMENTS.timer('chunk.fetch'):
+                    return downloader.next_chunk()
+
+            try:
+                if progress and total_size_bytes > 10 * 2**20: say('Starting ...')
+                while complete is False:
+                    if cancel is not None and cancel.is_set():
+                        raise KeyboardInterrupt
+                    before = downloader._progress
+                    chunk = downloader._chunksize = max(
+                        1, min(sizer.size, total_size_bytes - before)
                     )
-                with open(file_name.rsplit('.')[0] + '.xlsx', 'wb') as f:
-                    f.write(request.execute())
-                complete = True
+                    BANDWIDTH.consume(chunk, priority)
+                    with CHUNK_BUDGET.hold(chunk):
+                        began = time.monotonic()
+                        status, complete = GOVERNOR.call(next_chunk)
+                    INSTRUMENTS.count('bytes fetched',
+                                      status.resumable_progress - before)
+                    sizer.observe(status.resumable_progress - before,
+                                  time.monotonic() - began)
+                    partial.checkpoint(
+                        [[0, total_size_bytes - 1, status.resumable_progress]],
+                        fh.fileno()
+                    )
+                    transfer.update(status.resumable_progress)
+                broken = False
+            except HttpError as e:
+                broken = False
+                say(f'{Path(file_name).name}: {e}')
+
+            finally:
+                MEDIA_POOL.checkin(http, broken)
+                fh.close()
+
+            if complete and os.path.exists(partial.path):
+                return transfer.finish(
+                    BaseDownloader._finish(partial, meta, fh.md5)
+                )
+            return transfer.finish(complete)
 
-        print()
-        return complete
+    @staticmethod
+    def export_file(
+        file_id: str,
+        file_name: str,
+        mime_type: str,
+        cancel: threading.Event = None,
+        progress: bool = True
+    ) -> bool:
+        '''
+        Export a Google Workspace file (Doc, Sheet, Slides...)
+        ------------------------------------------------------
+        args      -> file_id   => str,
+                  -> file_name => str,
+                  -> mime_type => str (Workspace mimeType),
+                  -> cancel    => threading.Event / None,
+                  -> progress  => bool (default: True)
+
+        returns   -> complete  => bool
+
+        ------------------------------------------------------
+        The export format and extension come from EXPORT_FORMATS.
+        The export is streamed to disk in CHUNK_MAX_MB chunks
+        through MediaIoBaseDownload and only moved into place
+        once complete; an export cannot resume, so the .part
+        is removed when it fails or is cancelled. Types
+        without an entry are skipped.
+        '''
+        if mime_type not in EXPORT_FORMATS:
+            say(f'{Path(file_name).name}: no export format for '
+                f'{mime_type}, skipping.')
+            return False
+        export_mime, extension = EXPORT_FORMATS[mime_type]
+        if not file_name.lower().endswith(extension.lower()):
+            file_name += extension
+        request = get_drive().files().export_media(
+            fileId=file_id,
+            mimeType=export_mime,
+        )
+        part = file_name + '.part'
+        try:
+            with FileIO(part, 'wb') as fh, \
+                    METRICS.start(Path(file_name).name, None, 0, progress) as transfer:
+                with MEDIA_POOL.connection() as request.http:
+                    downloader = MediaIoBaseDownload(fh,
+                                                    request,
+                                                    chunksize=CHUNK_MAX_MB * 2**20)
+                    complete = False
+                    while complete is False:
+                        if cancel is not None and cancel.is_set():
+                            raise KeyboardInterrupt
+                        with CHUNK_BUDGET.hold(CHUNK_MAX_MB * 2**20):
+                            status, complete = GOVERNOR.call(downloader.next_chunk)
+                        transfer.size = status.total_size
+                        transfer.update(status.resumable_progress)
+                os.replace(part, file_name)
+                return transfer.finish(True)
+        except BaseException:
+            # an export cannot resume, keep nothing behind
+            if os.path.exists(part):
+                os.remove(part)
+            raise
+
+    @staticmethod
+    def _finish(partial: PartialFile, meta: dict, md5) -> bool:
+        '''
+        Move partial into place if md5 matches the remote
+        md5Checksum, else discard it.
+        '''
+        expected = meta.get('md5Checksum')
+        if expected and md5.hexdigest() != expected:
+            say(f"{Path(partial.file_name).name}: checksum mismatch, "
+                "discarding download.")
+            partial.discard()
+            return False
+        partial.finish()
+        return True
 
     @staticmethod
     @measure_time
@@ -314,31 +609,28 @@ class BaseDownloader:
         ------------------------------------------------------
         Given a folder name generates id, and recursively calls 
         itself with id, and then generates list of files/folders
-        in the given folder_name.
+        in the given folder_name. Every page is followed.
         '''
         if folder_id:
-            files = DRIVE.files().list(
-                                        q=f"'{folder_id}' in parents",
-                                        corpora='user'
-                                    ).execute().get('files', [])
+            files = list_children(folder_id)
             if not files:
                 raise ValueError(f"Empty folder: {folder_name}")
             return files
         else:
-            folder_name = folder_name.replace("'", "\\'")
-            query = (f"name contains '{folder_name}' "
+            query = (f"name contains '{_quote(folder_name)}' "
                       "and mimeType contains 'folder'")
             print(query)
-            folders = DRIVE.files().list(
+            folders = execute(get_drive().files().list(
                                             q=query, 
-                                            corpora='user'
-                                    ).execute().get('files', [])
+                                            corpora='user',
+                                            fields='files(id, name)'
+                                    )).get('files', [])
             
             if not folders:
                 raise ValueError("Empty Folder")
             if len(folders) > 1:
                 print(*enumerate(folders, start=1))
-                ix = int(input("Multiple items found, choose one: "), sep='\n')
+                ix = int(input("Multiple items found, choose one: ")) - 1
             else: ix = 0
             folder_id = folders[ix]['id']
             return BaseDownloader.get_folder_content(folder_name=None, folder_id=folder_id)
@@ -353,39 +645,38 @@ class FileDownload(BaseDownloader):
             self.files, self.parent = files
         else:
             self.files, self.parent = files, None
-        self.tot_files = len(files)
+        self.tot_files = len(self.files)
         self.target = target
         self.indivdual_folders = indivdual_folders
-        self.file_type = type(files[0])
 
-    def download(self):
-        if not os.path.isdir(self.target):os.mkdir(self.target)
+    def jobs(self) -> list[Job]:
+        """
+        self.files holds either names, resolved one by one,
+        or metadata dicts straight from a folder listing.
+        Nothing is created on disk until a job runs.
+        """
         self.tot_files = len(self.files)
-        print(f"Content:", *self.files, sep='\n')
-        for count, file in enumerate(self.files, start=1):
-            file_id = self.get_file_id(file, self.parent)
+        # one print per call, instructions are planned in parallel
+        say('\n'.join(['Content:', *(file['name'] if isinstance(file, dict)
+                                     else file for file in self.files)]))
+        jobs = []
+        for file in self.files:
+            meta = (file if isinstance(file, dict)
+                    else self.get_file(file, self.parent))
+            if meta.get('mimeType') == FOLDER_MIME:
+                continue
+            file = meta['name']
             filename = pjoin(self.target, file)
 
             if self.indivdual_folders:
                 fullpath = Path(filename).with_suffix('')
-
-                if not os.path.isdir(fullpath):
-                    os.mkdir(fullpath)
-                    filename = pjoin(fullpath, file)
+                filename = pjoin(fullpath, file)
             else:
                 fullpath = self.target
-           
-            if self.check_success(fullpath, file):
-                print(f"{file} already present")
-                continue
 
-            print(f"Downloading {count}/{self.tot_files}\n"
-                    f"Saving {file} in {fullpath} progress:")
-            complete = self.download_file(file_id, filename)
-            if complete:
-                self.write_success(fullpath, file)
-
-            print("File saved.")
+            jobs.append(Job(meta['id'], file, filename, str(fullpath), meta,
+                            INSTRUCTION.get(), PRIORITY.get()))
+        return jobs
 
 
 class FolderDownload(BaseDownloader):
@@ -394,42 +685,57 @@ class FolderDownload(BaseDownloader):
         self.folders = folders
         self.tot_folders = len(folders)
         self.target = target
-        if not os.path.isdir(self.target):os.mkdir(self.target)
         self.nested = nested
 
-    #TODO: implement recursion
-    def download(self):
-        folderid = None
-        if self.nested:
-            folder_contents = self.get_folder_content(folder_name=self.folders[0])
-            folderid = self.get_file_id(self.folders[0])
-            self.folders = [folder['name'] for folder in folder_contents]
+    def jobs(self) -> list[Job]:
+        """
+        Mirror every folder's whole tree under self.target.
+        self.folders holds folder names or folder metadata
+        dicts (as matched by Custom); all names are resolved
+        together, see resolve.resolve_names, and all trees
+        walked together, see tree.walk_all. With
+        nested==True the contents of self.folders[0] land
+        directly in self.target, one directory per
+        subfolder, instead of in self.target/<folder>.
+        """
         self.tot_folders = len(self.folders)
-        print(f"Content:", *self.folders, sep='\n')
-        for count, folder in enumerate(self.folders, start=1):
+        folders = self.folders[:1] if self.nested else self.folders
+        names = [folder for folder in folders if isinstance(folder, str)]
+        say('\n'.join(['Content:', *(folder if isinstance(folder, str)
+                                     else folder['name']
+                                     for folder in folders)]))
+        resolution = resolve_names(names, folders=True)
+        for folder, matches in resolution.ambiguous.items():
+            say(f"{folder}: {len(matches)} folders match, using "
+                f"{matches[0]['id']}")
+        for folder in resolution.missing:
+            say(f"{folder}: no such folder")
+        resolved = [(folder, resolution.found[folder]) for folder in names
+                    if folder in resolution.found]
+        resolved += [(folder['name'], folder) for folder in folders
+                     if isinstance(folder, dict)]
+        trees, errors = walk_all([meta['id'] for _, meta in resolved])
+        jobs = []
+        for folder, meta in resolved:
             try:
-                folder_id = self.get_file_id(folder, folderid)
-
+                if meta['id'] in errors:
+                    raise errors[meta['id']]
+                root = self.target if self.nested else pjoin(self.target, folder)
+                tree = {}
+                for rel, file_meta in trees[meta['id']]:
+                    tree.setdefault(rel, []).append(file_meta)
+                if not tree:
+                    raise ValueError(f"Empty folder: {folder}")
+                for rel, metas in tree.items():
+                    fl_downloader = FileDownload((metas, None),
+                                                 pjoin(root, rel),
+                                                 False
+                                                )
+                    jobs.extend(fl_downloader.jobs())
             except (HttpError, ValueError, FileNotFoundError, Exception) as e:
-                print(e)
-                continue
-            folder_name = pjoin(self.target, folder)
-            folder_contents = self.get_folder_content(folder, folder_id)
-            fl_downloader = FileDownload(([file['name'] for file 
-                                            in folder_contents], 
-                                          folder_id), 
-                                          folder_name, 
-                                          False
-                                        )
-
-            print(f"Downloading {count}/{self.tot_folders}\n"
-                  f"Saving {folder} in {self.target} progress:")
-            try:
-                fl_downloader.download()
-            except ValueError as e:
-                print(e)
+                say(e)
                 continue
-            print("File saved.")
+        return jobs
 
 class Custom(BaseDownloader):
     def __init__(self, search_terms, target, query_type):
@@ -437,25 +743,43 @@ class Custom(BaseDownloader):
         self.target = target
         self.search = search_terms
         self.query_type = query_type
-        self.filmdb = FilmDB(DATABASE)
+        self.filmdb = FilmDB.load(DATABASE)
 
-    def download(self):
+    def jobs(self) -> list[Job]:
+        """
+        Every film of every director in self.search, each
+        under self.target/<director>. Titles are matched
+        locally against the Drive folder inventory, see
+        matching.FolderIndex, instead of one search per
+        title; titles scoring below MATCH_THRESHOLD are
+        reported and skipped.
+        """
+        jobs = []
         if self.query_type.capitalize() == 'Director':
+            index = FolderIndex(folder_inventory())
             for query in self.search:
-                folders = self.filmdb.get_films(by='director', name=query)
-                self.target = pjoin(self.target, query)
-                if not os.path.isdir(self.target):os.mkdir(self.target)
-                print(f"Downloading films of {query}")
-                fl_downloader = FolderDownload(folders, self.target)
+                titles = self.filmdb.get_films(by='director', name=query)
+                target = pjoin(self.target, query)
+                say(f"Collecting films of {query}")
+                folders = []
+                for match in index.match(titles):
+                    if match.folder is None:
+                        say(f"{match.title}: no matching folder "
+                            f"(best score {match.score:.2f})")
+                    else:
+                        if match.score < 1:
+                            say(f"{match.title}: matched "
+                                f"{match.folder['name']} ({match.score:.2f})")
+                        folders.append(match.folder)
+                fl_downloader = FolderDownload(folders, target)
                 try:
-                    fl_downloader.download()
+                    jobs.extend(fl_downloader.jobs())
                 except ValueError as e:
-                    print(e)
+                    say(e)
                     continue
+        return jobs
 
 
-
-    
-
-
-    
+DOWNLOADERS = {
+    cls.__name__: cls for cls in (FileDownload, FolderDownload, Custom)
+}
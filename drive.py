@@ -0,0 +1,162 @@
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from collections import Counter
+from typing import TYPE_CHECKING, Any
+
+from httplib2 import Http
+
+from global_config import (ABSPATH, CONFIG_DIR, CRED_FILES, DRIVE_ENDPOINT,
+                           HTTP_IDLE_SECONDS, HTTP_MEDIA_POOL_SIZE,
+                           HTTP_POOL_SIZE, SCOPES)
+from governor import GOVERNOR
+from instrument import INSTRUMENTS
+from metrics import METRICS
+from transport import ConnectionPool, PooledHttp, Token
+
+if TYPE_CHECKING:
+    from googleapiclient.discovery import Resource
+    from googleapiclient.http import HttpRequest
+    from oauth2client.client import Credentials
+
+# __all__ = ['FOLDER_MIME', 'META_FIELDS', 'INSTRUCTION', 'API_CALLS',
+#            'get_credentials', 'discovery_document', 'POOL',
+#            'MEDIA_POOL', 'get_drive', 'execute']
+
+FOLDER_MIME = 'application/vnd.google-apps.folder'
+META_FIELDS = 'id, name, size, mimeType, md5Checksum, modifiedTime'
+
+DISCOVERY_DOC = ABSPATH / CONFIG_DIR / 'drive_v3.json'
+DISCOVERY_URL = 'https://www.googleapis.com/discovery/v1/apis/drive/v3/rest'
+# another server speaking the Drive v3 API (e.g. fakedrive.py), no auth
+ENDPOINT = os.environ.get('DRIVE_ENDPOINT', DRIVE_ENDPOINT).rstrip('/')
+
+_calls_lock = threading.Lock()
+_creds = None
+_creds_lock = threading.Lock()
+_drive = None
+_drive_lock = threading.Lock()
+
+INSTRUCTION = contextvars.ContextVar('instruction', default='-')
+API_CALLS = Counter()
+
+
+def get_credentials() -> "Credentials":
+    """
+    OAuth credentials, loaded (or authorized) on first use.
+    -----------------------------------------------------
+    returns -> creds => oauth2client Credentials
+    """
+    global _creds
+    with _creds_lock:
+        if _creds is None:
+            from oauth2client import client, file, tools
+
+            store = file.Storage(ABSPATH / CONFIG_DIR / CRED_FILES['storage_file'])
+            creds = store.get()
+            if not creds or creds.invalid:
+                flow = client.flow_from_clientsecrets(
+                    ABSPATH / CONFIG_DIR / CRED_FILES['cred_file'], SCOPES
+                )
+                creds = tools.run_flow(flow, store)
+            _creds = creds
+        return _creds
+
+
+@functools.lru_cache(maxsize=None)
+def discovery_document() -> dict:
+    """
+    The Drive v3 discovery document, parsed once per process.
+    -----------------------------------------------------
+    returns -> document => dict
+
+    -----------------------------------------------------
+    Read from config/drive_v3.json. On first use the file
+    is filled from the copy bundled with googleapiclient,
+    or fetched once if the library has none.
+    """
+    try:
+        with open(DISCOVERY_DOC, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    from googleapiclient.discovery_cache import get_static_doc
+
+    content = get_static_doc('drive', 'v3')
+    if content is None:
+        _, content = Http().request(DISCOVERY_URL)
+        content = content.decode('utf-8')
+    document = json.loads(content)
+    with open(DISCOVERY_DOC, 'w', encoding='utf-8') as f:
+        json.dump(document, f)
+    return document
+
+
+# keep-alive connections for API requests, all sending the one
+# centrally refreshed token (none with ENDPOINT set)
+TOKEN = None if ENDPOINT else Token(get_credentials)
+POOL = ConnectionPool(lambda: PooledHttp(TOKEN), HTTP_POOL_SIZE,
+                      HTTP_IDLE_SECONDS)
+# downloads hold a connection for a whole file or span, so they get
+# their own pool and never keep API calls waiting
+MEDIA_POOL = ConnectionPool(lambda: PooledHttp(TOKEN), HTTP_MEDIA_POOL_SIZE,
+                            HTTP_IDLE_SECONDS)
+
+
+def get_drive() -> "Resource":
+    """
+    The Drive service, built once from the cached
+    discovery document.
+    -----------------------------------------------------
+    returns -> drive => googleapiclient Resource
+
+    -----------------------------------------------------
+    The service only builds requests and is shared by
+    every thread; httplib2.Http is not thread-safe, so
+    requests are sent on a connection from POOL (see
+    execute). With ENDPOINT set, requests go there
+    instead of www.googleapis.com.
+    """
+    global _drive
+    with _drive_lock:
+        if _drive is None:
+            from googleapiclient.discovery import build_from_document
+
+            document = discovery_document()
+            if ENDPOINT:
+                document = {**document, 'rootUrl': f'{ENDPOINT}/',
+                            'mtlsRootUrl': f'{ENDPOINT}/',
+                            'baseUrl': f"{ENDPOINT}/{document['servicePath']}"}
+            _drive = build_from_document(document, http=PooledHttp())
+    return _drive
+
+
+def execute(request: "HttpRequest", **kwargs: Any) -> Any:
+    """
+    Execute a Drive API request through GOVERNOR on a
+    connection checked out of POOL, counting every attempt
+    against the current INSTRUCTION and timing it in
+    METRICS.
+    -----------------------------------------------------
+    args    -> request => HttpRequest,
+            -> kwargs  => passed on to request.execute
+
+    returns -> response
+    """
+    method = getattr(request, 'methodId', type(request).__name__)
+
+    def attempt() -> Any:
+        with _calls_lock:
+            API_CALLS[INSTRUCTION.get()] += 1
+        began = time.monotonic()
+        try:
+            with POOL.connection() as http, \
+                    INSTRUMENTS.timer(f'api.{method}'):
+                return request.execute(http=http, **kwargs)
+        finally:
+            METRICS.api_call(method, time.monotonic() - began)
+
+    return GOVERNOR.call(attempt)
@@ -1,30 +1,40 @@
 # import global_config
+from global_config import INVALIDATE_CACHE
+
+if INVALIDATE_CACHE:
+    # only the cache is needed, not the Drive client stack
+    from cache import CACHE
+    print(f"Dropped {CACHE.invalidate()} cached Drive entries.")
+    raise SystemExit(0)
+
 from downoptions import *
+from executor import Executor
+from plan import HISTORY
+from store import STORE
+from throttle import reload_limit
+import signal
+
+if hasattr(signal, 'SIGHUP'):
+    signal.signal(signal.SIGHUP, reload_limit)
 
-for instr in instruction_set:
-    if instr.special:
-        downloader = globals()[instr.method](
-                                                instr.args, 
-                                                instr.target, 
-                                                instr.special
-                                            )
-    else:
-        downloader = globals()[instr.method](
-                                                instr.args, 
-                                                instr.target
-                                            )
-            
-    try:
-        downloader.download()
-    except KeyboardInterrupt:
-        last_updated_path = Path(downloader.last_updated_path)
+executor = Executor(instruction_set)
+plan = executor.schedule()
+plan.save(ABSPATH / DATA_DIR / PLAN_FILE, HISTORY.rate())
+if DRY_RUN:
+    print(plan.report(HISTORY.rate()))
+    raise SystemExit(0)
+try:
+    results = executor.execute(plan)
+except KeyboardInterrupt:
+    for last_updated_path in map(Path, executor.engine.incomplete()):
         dirname, filename = last_updated_path.parent, last_updated_path.name
-        success = downloader.check_success(dirname, filename)
-        if not success:
-            print(f"Last updated file: {filename}"
-                    f" at {dirname}, is incomplete"
-                    "\n Removing file...")
-            os.remove(last_updated_path)
-            print("File removed.")
-    finally:
-        break
+        print(f"Last updated file: {filename}"
+                f" at {dirname}, is incomplete"
+                "\n Kept as .part, rerun to resume.")
+else:
+    for result in results:
+        print(result)
+    if STORE.placed:
+        print(f"{sum(STORE.placed.values())} duplicate files placed locally "
+              f"({', '.join(f'{n} {how}' for how, n in STORE.placed.items())}), "
+              f"{bytes_to_MB(STORE.saved):.2f} MB not downloaded.")
@@ -0,0 +1,152 @@
+import contextvars
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterable, NamedTuple, Optional
+
+from global_config import WORKERS
+from utils import say
+
+# __all__ = ['Job', 'size_of', 'DownloadEngine']
+
+
+class Job(NamedTuple):
+    file_id: str
+    name: str
+    path: str
+    fullpath: str
+    meta: Optional[dict] = None
+    instruction: str = '-'
+    priority: int = 0
+
+
+def size_of(job: Job) -> int:
+    """Drive size of job, 0 when unknown (Workspace files)."""
+    return int((job.meta or {}).get('size') or 0)
+
+
+class DownloadEngine:
+    """
+    Worker pool that downloads several files at once.
+    -----------------------------------------------------
+    args    -> download      => Callable(job, cancel, progress) -> bool
+            -> check_success => Callable(fullpath, name) -> bool
+            -> write_success => Callable(fullpath, name, meta) -> None
+            -> workers       => int (default: WORKERS)
+
+    -----------------------------------------------------
+    Every job runs on a pool thread, so an Http it uses
+    must be its own for the time being (drive.MEDIA_POOL).
+    Jobs for the same path never run at the same time,
+    the later one waits and then finds the file present.
+    After start() every run() shares one long-lived pool,
+    so the threads and their connections stay warm, and
+    several run() calls may be in flight at once; close()
+    ends it.
+    """
+
+    def __init__(
+        self,
+        download: Callable[..., bool],
+        check_success: Callable[[str, str], bool],
+        write_success: Callable[[str, str, dict], None],
+        workers: int = WORKERS,
+    ):
+        self.download = download
+        self.check_success = check_success
+        self.write_success = write_success
+        self.workers = max(1, int(workers))
+        self.cancel = threading.Event()
+        self.in_progress = set()
+        self._active = set()
+        self._pool = None
+        self._lock = threading.Condition()
+
+    def start(self) -> None:
+        """Keep one pool for every later run()."""
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.workers,
+                                            thread_name_prefix='download')
+
+    def close(self) -> None:
+        """Drop queued jobs and wait for the running ones."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def _run_job(self, job: Job) -> bool:
+        if self.cancel.is_set():
+            return False
+        with self._lock:
+            self._lock.wait_for(lambda: job.path not in self._active)
+            self._active.add(job.path)
+        try:
+            if self.check_success(job.fullpath, job.name):
+                say(f"{job.name} already present")
+                return True
+
+            with self._lock:
+                self.in_progress.add(job.path)
+            # planning creates nothing, the directory is made here
+            os.makedirs(os.path.dirname(job.path), exist_ok=True)
+            say(f"Saving {job.name} in {job.fullpath}")
+            complete = self.download(job, self.cancel, self.workers == 1)
+            if complete:
+                self.write_success(job.fullpath, job.name, job.meta)
+                with self._lock:
+                    self.in_progress.discard(job.path)
+            return complete
+        finally:
+            with self._lock:
+                self._active.discard(job.path)
+                self._lock.notify_all()
+
+    def run(self, jobs: Iterable[Job]) -> dict[str, bool]:
+        """
+        Download every job, at most self.workers at a time.
+        -----------------------------------------------------
+        args    -> jobs    => Iterable[Job]
+
+        returns -> results => dict[str, bool] (keyed by job.path)
+
+        -----------------------------------------------------
+        Jobs of higher priority are started first, and
+        within a priority the largest first (LPT), so the
+        pool does not end on one big file with the other
+        workers idle.
+        On KeyboardInterrupt queued jobs are dropped, running
+        ones stop at their next chunk, and the interrupt is
+        re-raised with self.in_progress holding the paths
+        that were left incomplete.
+        """
+        jobs = sorted(jobs, key=lambda job: (-job.priority, -size_of(job)))
+        results = {}
+        pool = self._pool or ThreadPoolExecutor(self.workers,
+                                                thread_name_prefix='download')
+        try:
+            futures = {
+                pool.submit(contextvars.copy_context().run, self._run_job, job): job
+                for job in jobs
+            }
+            for count, future in enumerate(as_completed(futures), start=1):
+                job = futures[future]
+                try:
+                    results[job.path] = future.result()
+                except Exception as e:
+                    say(f"{job.name}: {e}")
+                    results[job.path] = False
+                status = 'saved' if results[job.path] else 'failed'
+                say(f"[{count}/{len(jobs)}] {job.name} {status}.")
+        except KeyboardInterrupt:
+            self.cancel.set()
+            raise
+        finally:
+            if pool is not self._pool:
+                pool.shutdown(wait=True, cancel_futures=True)
+        return results
+
+    def incomplete(self) -> list[str]:
+        """Paths that were started but not finished."""
+        with self._lock:
+            return [path for path in self.in_progress
+                    if os.path.exists(path + '.part')]
@@ -0,0 +1,247 @@
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+
+from downoptions import DOWNLOADERS, BaseDownloader
+from drive import API_CALLS, INSTRUCTION
+from engine import DownloadEngine, Job, size_of
+from global_config import INSTRUCTION_WORKERS, Instruction
+from metrics import METRICS
+from plan import ACTIONS, HISTORY, Plan, PlanItem
+from store import STORE
+from throttle import PRIORITY
+from verify import find_identical
+from utils import say
+
+# __all__ = ['InstructionResult', 'Executor']
+
+
+class InstructionResult(NamedTuple):
+    label: str
+    ok: bool
+    done: int
+    total: int
+    api_calls: int
+    error: Optional[str] = None
+
+    def __str__(self) -> str:
+        status = 'ok' if self.ok else 'FAILED'
+        return (f"[{status}] {self.label}: {self.done}/{self.total} files, "
+                f"{self.api_calls} Drive API calls"
+                + (f" ({self.error})" if self.error else ""))
+
+
+def label_of(instr: Instruction) -> str:
+    # the whole DOWNLOAD= line: two instructions that differ only in
+    # target, special or priority must not share their Jobs
+    return (f"{instr.method}|{'^'.join(instr.args)}|{instr.target}|"
+            f"{instr.special}|{instr.priority}")
+
+
+class Executor:
+    """
+    Runs every instruction of an instruction set.
+    -----------------------------------------------------
+    args    -> instructions => list[Instruction],
+            -> workers      => int (default: INSTRUCTION_WORKERS),
+            -> engine       => DownloadEngine / None (shared engine),
+            -> planner      => ThreadPoolExecutor / None (shared pool)
+
+    -----------------------------------------------------
+    Instructions are resolved into Jobs at the same time,
+    at most workers at once, and scheduled into a Plan
+    (see schedule()); its downloads then all go through
+    one shared DownloadEngine, higher priority and then
+    larger files first. Files with the same content
+    (Drive md5Checksum and size) are downloaded once and
+    placed at their other destinations from the local
+    copy, as is content already in the STORE from an
+    earlier run, unless DEDUP is 'off'; see
+    store.ContentStore. A failing instruction is reported
+    and does not stop the others.
+    """
+
+    def __init__(
+        self,
+        instructions: list[Instruction],
+        workers: int = INSTRUCTION_WORKERS,
+        engine: Optional[DownloadEngine] = None,
+        planner: Optional[ThreadPoolExecutor] = None
+    ):
+        self.instructions = list(instructions)
+        self.workers = max(1, int(workers))
+        self.engine = engine or DownloadEngine(
+            BaseDownloader._download_job,
+            BaseDownloader.check_success,
+            BaseDownloader.write_success,
+        )
+        self.planner = planner
+
+    @staticmethod
+    def _plan_one(instr: Instruction) -> list[Job]:
+        INSTRUCTION.set(label_of(instr))
+        PRIORITY.set(instr.priority)
+        cls = DOWNLOADERS[instr.method]
+        if instr.special:
+            downloader = cls(instr.args, instr.target, instr.special)
+        else:
+            downloader = cls(instr.args, instr.target)
+        return downloader.jobs()
+
+    def plan(self) -> tuple[dict[str, list[Job]], dict[str, str]]:
+        """
+        Resolve every instruction into its Jobs.
+        -----------------------------------------------------
+        returns -> (jobs, errors) => (label -> Jobs, label -> error)
+        """
+        jobs, errors = {}, {}
+        pool = self.planner or ThreadPoolExecutor(self.workers,
+                                                  thread_name_prefix='plan')
+        try:
+            futures = {
+                label_of(instr): pool.submit(
+                    contextvars.copy_context().run, self._plan_one, instr
+                )
+                for instr in self.instructions
+            }
+            for label, future in futures.items():
+                try:
+                    jobs[label] = future.result()
+                except Exception as e:
+                    errors[label] = f"{type(e).__name__}: {e}"
+        finally:
+            if pool is not self.planner:
+                pool.shutdown(wait=True)
+        return jobs, errors
+
+    @staticmethod
+    def _place(job: Job, source: str) -> bool:
+        if BaseDownloader.check_success(job.fullpath, job.name):
+            return True
+        size = size_of(job)
+        try:
+            os.makedirs(os.path.dirname(job.path), exist_ok=True)
+            method = STORE.place(source, job.path, size)
+        except OSError as e:
+            say(f"{job.name}: {e}")
+            return False
+        BaseDownloader.write_success(job.fullpath, job.name, job.meta)
+        say(f"{job.name} {method} of {source}")
+        return True
+
+    @staticmethod
+    def content_key(job: Job) -> tuple:
+        # an export is named after its format, so it is never a copy
+        if STORE.mode == 'off':
+            return (job.file_id, job.path)
+        return STORE.key(job.meta) or (job.file_id, job.path)
+
+    def schedule(self) -> Plan:
+        """
+        Plan every instruction without downloading anything.
+        -----------------------------------------------------
+        returns -> plan => Plan
+
+        -----------------------------------------------------
+        Nothing is written under the targets, no directory
+        created and no Ledger migrated, so this is what
+        --dry-run shows.
+        Of every group of jobs with the same content the one
+        of highest priority is fetched (or found locally) and
+        the rest are copies of it.
+        """
+        planned, errors = self.plan()
+        jobs = sorted((job for jobs in planned.values() for job in jobs),
+                      key=lambda job: (-job.priority, -size_of(job)))
+        primary = {}
+        for job in jobs:
+            primary.setdefault(self.content_key(job), job)
+        unique = list(primary.values())
+        present = {job.path for job in unique
+                   if BaseDownloader.check_success(job.fullpath, job.name)}
+        identical = {job.path for job in find_identical(
+            job for job in unique if job.path not in present
+        )}
+
+        items = []
+        for job in unique:
+            stored = (None if job.path in present or job.path in identical
+                      else STORE.find(job.meta))
+            if job.path in present:
+                items.append(PlanItem(job, 'present'))
+            elif job.path in identical:
+                items.append(PlanItem(job, 'identical'))
+            elif stored is not None and stored != os.path.abspath(job.path):
+                items.append(PlanItem(job, 'place', stored))
+            else:
+                items.append(PlanItem(job, 'download'))
+        for job in jobs:
+            source = primary[self.content_key(job)]
+            if source is job:
+                continue
+            if BaseDownloader.check_success(job.fullpath, job.name):
+                items.append(PlanItem(job, 'present'))
+            else:
+                items.append(PlanItem(job, 'copy', source.path))
+        items.sort(key=lambda item: ACTIONS.index(item.action))
+        return Plan(items, errors)
+
+    def execute(self, plan: Plan) -> list[InstructionResult]:
+        """
+        Carry out plan and report every instruction.
+        -----------------------------------------------------
+        args    -> plan    => Plan (from schedule())
+
+        returns -> results => list[InstructionResult]
+
+        -----------------------------------------------------
+        The bytes and time of the downloads are added to
+        HISTORY for later ETAs. KeyboardInterrupt propagates,
+        self.engine.incomplete() then lists the partial files
+        left behind.
+        """
+        results = {}
+        for item in plan.by_action('present'):
+            say(f"{item.job.name} already present")
+            results[item.job.path] = True
+        for item in plan.by_action('identical'):
+            job = item.job
+            say(f"{job.name} already present (checksum match)")
+            BaseDownloader.write_success(job.fullpath, job.name, job.meta)
+            results[job.path] = True
+        for item in plan.by_action('place'):
+            results[item.job.path] = self._place(item.job, item.source)
+
+        downloads = [item.job for item in plan.by_action('download')]
+        received, began = METRICS.totals()['bytes'], time.monotonic()
+        results.update(self.engine.run(downloads))
+        HISTORY.record(METRICS.totals()['bytes'] - received,
+                       time.monotonic() - began, len(downloads))
+
+        for item in plan.by_action('copy'):
+            results[item.job.path] = (results[item.source]
+                                      and self._place(item.job, item.source))
+
+        by_label = {}
+        for item in plan.items:
+            by_label.setdefault(item.job.instruction, []).append(item.job)
+        report = []
+        for instr in self.instructions:
+            label = label_of(instr)
+            if label in plan.errors:
+                report.append(InstructionResult(
+                    label, False, 0, 0, API_CALLS[label], plan.errors[label]
+                ))
+                continue
+            jobs = by_label.get(label, [])
+            done = sum(results[job.path] for job in jobs)
+            report.append(InstructionResult(
+                label, done == len(jobs), done, len(jobs), API_CALLS[label]
+            ))
+        return report
+
+    def run(self) -> list[InstructionResult]:
+        """Plan, download and report every instruction."""
+        return self.execute(self.schedule())
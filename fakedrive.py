@@ -0,0 +1,421 @@
+"""
+A local stand-in for the Drive v3 endpoints DriveDownload uses.
+
+Usage: python fakedrive.py [--films 20] [--files 3] [--size-mb 4]
+                           [--latency-ms 20] [--rate-mbps 50] [--port 8000]
+
+then set DRIVE_ENDPOINT=http://127.0.0.1:8000 (environment or
+settings.json) to run driver.py against it without credentials.
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple, Optional
+from urllib.parse import parse_qs, urlsplit
+
+# __all__ = ['FakeDrive', 'Film', 'FakeDriveHandler', 'serve']
+
+FOLDER_MIME = 'application/vnd.google-apps.folder'
+DOC_MIME = 'application/vnd.google-apps.document'
+BLOCK = 64 * 2**10
+MODIFIED = '2021-06-01T00:00:00.000Z'
+
+QUOTED = r"'((?:[^'\\]|\\.)*)'"
+PARENT = re.compile(QUOTED + r" in parents")
+NAME_IS = re.compile(r"name = " + QUOTED)
+NAME_HAS = re.compile(r"name contains " + QUOTED)
+MIME_IS = re.compile(r"mimeType = " + QUOTED)
+MIME_NOT = re.compile(r"mimeType != " + QUOTED)
+
+WORDS = ('Vérité', 'Corbeau', 'Orfèvres', 'Salaire', 'Samouraï', 'Café',
+         'River', 'Night', 'Summer', 'Stranger', 'Journey', 'Mirror',
+         'Silence', 'Wind', 'Harbour', 'Garden', 'Shadow', 'Train')
+DIRECTORS = ('Henri-Georges Clouzot', 'Edward Yang', 'Agnès Varda',
+             'Asghar Farhadi', 'Ken Loach')
+
+
+def _unquote(text: str) -> str:
+    return re.sub(r"\\(.)", r"\1", text)
+
+
+class Film(NamedTuple):
+    title: str
+    director: str
+    year: int
+
+
+class FakeDrive:
+    """
+    An in-memory Drive: folder tree, metadata and content.
+    -----------------------------------------------------
+    File content is a per-file random 64 KiB block repeated
+    up to the file's size, so large trees cost no memory;
+    md5Checksum is computed over it when the file is added.
+    """
+
+    def __init__(self, seed: int = 0):
+        self.files = {}
+        self._blocks = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _new_id(self) -> str:
+        return f'fake{len(self.files):08d}'
+
+    def add_folder(self, name: str, parent: Optional[str] = None) -> str:
+        with self._lock:
+            file_id = self._new_id()
+            self.files[file_id] = {
+                'id': file_id, 'name': name, 'mimeType': FOLDER_MIME,
+                'modifiedTime': MODIFIED, 'parents': [parent or 'root'],
+            }
+        return file_id
+
+    def add_file(
+        self,
+        name: str,
+        parent: Optional[str],
+        size: int,
+        mime_type: str = 'video/x-matroska'
+    ) -> str:
+        """Add a file of size bytes (a Workspace file if mime_type is one)."""
+        block = self._random.randbytes(BLOCK)
+        md5 = hashlib.md5()
+        for offset in range(0, size, BLOCK):
+            md5.update(block[:min(BLOCK, size - offset)])
+        with self._lock:
+            file_id = self._new_id()
+            meta = {
+                'id': file_id, 'name': name, 'mimeType': mime_type,
+                'modifiedTime': MODIFIED, 'parents': [parent or 'root'],
+            }
+            if not mime_type.startswith('application/vnd.google-apps.'):
+                meta.update(size=str(size), md5Checksum=md5.hexdigest())
+            self.files[file_id] = meta
+            self._blocks[file_id] = (block, size)
+        return file_id
+
+    def add_copy(self, file_id: str, name: str, parent: Optional[str]) -> str:
+        """Add another file with the content of file_id."""
+        with self._lock:
+            copy_id = self._new_id()
+            self.files[copy_id] = {**self.files[file_id], 'id': copy_id,
+                                   'name': name, 'parents': [parent or 'root']}
+            self._blocks[copy_id] = self._blocks[file_id]
+        return copy_id
+
+    def size(self, file_id: str) -> int:
+        return self._blocks[file_id][1]
+
+    def data(self, file_id: str, start: int, end: int) -> bytes:
+        """Bytes start..end (inclusive) of the file's content."""
+        block, _ = self._blocks[file_id]
+        out = bytearray()
+        while start <= end:
+            offset = start % BLOCK
+            piece = block[offset:min(BLOCK, offset + end - start + 1)]
+            out += piece
+            start += len(piece)
+        return bytes(out)
+
+    def query(self, q: str) -> list[dict]:
+        """
+        Files matching a files.list q, sorted by name.
+        -----------------------------------------------------
+        Understands the clauses DriveDownload sends: parents,
+        OR-ed 'name =' (case-insensitive), 'name contains'
+        and mimeType (in)equality. Nothing is ever trashed.
+        """
+        parents = set(PARENT.findall(q))
+        names = {_unquote(name).casefold() for name in NAME_IS.findall(q)}
+        contains = [_unquote(part).casefold() for part in NAME_HAS.findall(q)]
+        mime_is = set(MIME_IS.findall(q))
+        mime_not = set(MIME_NOT.findall(q))
+        found = []
+        for meta in self.files.values():
+            name = meta['name'].casefold()
+            if parents and not parents & set(meta['parents']):
+                continue
+            if names and name not in names:
+                continue
+            if any(part not in name for part in contains):
+                continue
+            if mime_is and meta['mimeType'] not in mime_is:
+                continue
+            if meta['mimeType'] in mime_not:
+                continue
+            found.append(meta)
+        return sorted(found, key=lambda meta: (meta['name'], meta['id']))
+
+    @classmethod
+    def synthetic(
+        cls,
+        films: int = 20,
+        files: int = 3,
+        size: int = 4 * 2**20,
+        depth: int = 2,
+        docs: int = 1,
+        shared: int = 1,
+        seed: int = 0
+    ) -> tuple['FakeDrive', list[Film]]:
+        """
+        A Drive holding one folder per film.
+        -----------------------------------------------------
+        args    -> films  => int (film folders),
+                -> files  => int (files per folder),
+                -> size   => int (bytes of the first file of a folder,
+                                  the others are a tenth of it),
+                -> depth  => int (1: flat, 2: plus an 'Extras' subfolder),
+                -> docs   => int (Google Docs per folder),
+                -> shared => int (files with the same content in every
+                                  folder, a tenth of size each),
+                -> seed   => int
+
+        returns -> (drive, films) => (FakeDrive, list[Film])
+
+        -----------------------------------------------------
+        Folder names carry accents and punctuation, the
+        returned Film titles are plain ASCII, as they would
+        be in the FilmDB spreadsheet.
+        """
+        drive = cls(seed)
+        rnd = random.Random(seed)
+        catalogue = []
+        root = drive.add_folder('Films')
+        packs = [drive.add_file(f'Subtitles {index}.zip', root,
+                                max(1, size // 10), 'application/zip')
+                 for index in range(shared)]
+        for number in range(films):
+            words = ' '.join(rnd.sample(WORDS, 2))
+            year = rnd.randint(1940, 2020)
+            folder = f"{words}: No. {number} ({year})"
+            title = f"{words} No {number} ({year})"
+            title = title.translate(str.maketrans('éèïà', 'eeia'))
+            catalogue.append(Film(title, rnd.choice(DIRECTORS), year))
+            folder_id = drive.add_folder(folder, root)
+            parents = [folder_id]
+            if depth > 1:
+                parents.append(drive.add_folder('Extras', folder_id))
+            for index in range(files):
+                parent = parents[index % len(parents)]
+                drive.add_file(f"{words} {number} - {index}.mkv", parent,
+                               size if index == 0 else max(1, size // 10))
+            for index in range(docs):
+                drive.add_file(f"{words} {number} notes {index}", folder_id,
+                               BLOCK, DOC_MIME)
+            for index, pack in enumerate(packs):
+                drive.add_copy(pack, f'Subtitles {index}.zip', folder_id)
+        return drive, catalogue
+
+
+class FakeDriveHandler(BaseHTTPRequestHandler):
+    """
+    Serves server.drive under /drive/v3 and /batch/drive/v3.
+    -----------------------------------------------------
+    server.latency is added to every request and media is
+    sent at most at server.rate bytes per second per
+    connection (0: unlimited). With probability
+    server.error_rate a request fails with 429 (with
+    Retry-After) or 503 instead. server.stats counts the
+    requests served by kind.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _count(self, kind: str) -> None:
+        with self.server.lock:
+            self.server.stats[kind] += 1
+
+    def _send_json(self, status: int, body: dict, headers: dict = {}) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _inject(self) -> bool:
+        """Sleep server.latency, maybe answer with an error."""
+        time.sleep(self.server.latency)
+        if self.server.random.random() >= self.server.error_rate:
+            return False
+        self._count('errors')
+        if self.server.random.random() < 0.5:
+            self._send_json(429, {'error': {'code': 429,
+                                            'message': 'Rate Limit Exceeded'}},
+                            {'Retry-After': '1'})
+        else:
+            self._send_json(503, {'error': {'code': 503,
+                                            'message': 'Backend Error'}})
+        return True
+
+    def _api(self, path: str, params: dict) -> tuple[int, dict]:
+        """JSON answer of a metadata request."""
+        drive = self.server.drive
+        if path == '/drive/v3/files':
+            self._count('list')
+            files = drive.query(params.get('q', ''))
+            page_size = int(params.get('pageSize', 100))
+            start = int(params.get('pageToken', 0))
+            body = {'files': files[start:start + page_size]}
+            if start + page_size < len(files):
+                body['nextPageToken'] = str(start + page_size)
+            return 200, body
+        match = re.fullmatch(r'/drive/v3/files/([^/]+)', path)
+        if match and match.group(1) in drive.files:
+            self._count('get')
+            return 200, drive.files[match.group(1)]
+        return 404, {'error': {'code': 404, 'message': f'Not found: {path}'}}
+
+    def _media(self, file_id: str) -> None:
+        drive = self.server.drive
+        size = drive.size(file_id)
+        start, end = 0, size - 1
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('range', ''))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2) or end), end)
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+
+        began = time.monotonic()
+        for offset in range(start, end + 1, BLOCK):
+            stop = min(offset + BLOCK, end + 1)
+            self.wfile.write(drive.data(file_id, offset, stop - 1))
+            with self.server.lock:
+                self.server.stats['bytes'] += stop - offset
+            if self.server.rate:
+                lag = ((stop - start) / self.server.rate
+                       - (time.monotonic() - began))
+                if lag > 0:
+                    time.sleep(lag)
+
+    def do_GET(self):
+        if self._inject():
+            return
+        url = urlsplit(self.path)
+        params = {key: values[-1] for key, values
+                  in parse_qs(url.query).items()}
+        match = re.fullmatch(r'/drive/v3/files/([^/]+)(/export)?', url.path)
+        if match and match.group(1) in self.server.drive.files:
+            if match.group(2):
+                self._count('export')
+                return self._media(match.group(1))
+            if params.get('alt') == 'media':
+                self._count('media')
+                return self._media(match.group(1))
+        self._send_json(*self._api(url.path, params))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('content-length', 0)))
+        if self._inject():
+            return
+        if urlsplit(self.path).path != '/batch/drive/v3':
+            return self._send_json(404, {'error': {'code': 404,
+                                                   'message': 'Not found'}})
+        self._count('batch')
+        message = BytesParser().parsebytes(
+            f"Content-Type: {self.headers['content-type']}\r\n\r\n".encode()
+            + body
+        )
+        boundary = 'fakedrive_batch'
+        parts = []
+        for part in message.get_payload():
+            request_line = part.get_payload().split('\n', 1)[0]
+            _, target, _ = request_line.split(' ', 2)
+            url = urlsplit(target)
+            params = {key: values[-1] for key, values
+                      in parse_qs(url.query).items()}
+            status, answer = self._api(url.path, params)
+            parts.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{part['Content-ID'][1:-1]}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{json.dumps(answer)}\r\n"
+            )
+        data = (''.join(parts) + f"--{boundary}--\r\n").encode()
+        self.send_response(200)
+        self.send_header('Content-Type',
+                         f'multipart/mixed; boundary={boundary}')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve(
+    drive: FakeDrive,
+    latency: float = 0.0,
+    rate: float = 0.0,
+    error_rate: float = 0.0,
+    port: int = 0,
+    seed: int = 0
+) -> ThreadingHTTPServer:
+    """
+    Serve drive on localhost from a background thread.
+    -----------------------------------------------------
+    args    -> drive      => FakeDrive,
+            -> latency    => float (seconds added to every request),
+            -> rate       => float (bytes per second per connection, 0: unlimited),
+            -> error_rate => float (share of requests that fail),
+            -> port       => int (0: any free port),
+            -> seed       => int (for error injection)
+
+    returns -> server     => ThreadingHTTPServer
+
+    -----------------------------------------------------
+    The endpoint is f'http://127.0.0.1:{server.server_port}'.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), FakeDriveHandler)
+    server.drive = drive
+    server.latency = latency
+    server.rate = rate
+    server.error_rate = error_rate
+    server.random = random.Random(seed)
+    server.stats = Counter()
+    server.lock = threading.Lock()
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--films', type=int, default=20)
+    parser.add_argument('--files', type=int, default=3)
+    parser.add_argument('--size-mb', type=float, default=4)
+    parser.add_argument('--depth', type=int, default=2)
+    parser.add_argument('--latency-ms', type=float, default=20)
+    parser.add_argument('--rate-mbps', type=float, default=50)
+    parser.add_argument('--error-rate', type=float, default=0)
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+
+    drive, films = FakeDrive.synthetic(args.films, args.files,
+                                       int(args.size_mb * 2**20), args.depth)
+    server = serve(drive, args.latency_ms / 1000, args.rate_mbps * 2**20,
+                   args.error_rate, args.port)
+    print(f"DRIVE_ENDPOINT=http://127.0.0.1:{server.server_port}")
+    for film in films:
+        print(f"{film.director}: {film.title}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
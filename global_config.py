@@ -2,14 +2,9 @@ import json
 import pathlib
 import os
 from os.path import join as pjoin
-from typing import NamedTuple, Any
+from typing import NamedTuple, Any, Optional
 from utils import PathLike, chdir
 
-from googleapiclient import discovery
-from googleapiclient.http import MediaIoBaseDownload
-from io import FileIO
-from httplib2 import Http
-from oauth2client import file, client, tools
 from ast import literal_eval
 from collections import namedtuple
 import argparse
@@ -29,7 +24,37 @@ parser.add_argument(
     type=str, 
     default='settings.json'
 )
+parser.add_argument(
+    "--invalidate-cache",
+    help="forget cached Drive metadata and exit",
+    action='store_true'
+)
+parser.add_argument(
+    "--dry-run",
+    help="only plan: save data/plan.json and report sizes, ETA and space",
+    action='store_true'
+)
+parser.add_argument(
+    "--instrument",
+    help="time the hot paths and print a summary at exit",
+    action='store_true'
+)
+parser.add_argument(
+    "--profile",
+    help="write a cProfile of the run to this file (implies --instrument)",
+    type=str
+)
+parser.add_argument(
+    "--trace",
+    help="write a Chrome trace of the run to this file (implies --instrument)",
+    type=str
+)
 args = parser.parse_args()
+INVALIDATE_CACHE = args.invalidate_cache
+DRY_RUN = args.dry_run
+if args.instrument or args.profile or args.trace:
+    from instrument import INSTRUMENTS
+    INSTRUMENTS.start(args.profile, args.trace)
 
 
 instruction_set = []
@@ -43,13 +68,15 @@ class Instruction(NamedTuple):
     args: list[str]
     target: pathlib.Path
     special: Any
+    priority: int = 0
 
 
 def __instructions(
     class_type: str, 
     args: str, 
     target: PathLike, 
-    special: str) -> Instruction:
+    special: str,
+    priority: str = '0') -> Instruction:
     """Create instruction sets.
 
     Args:
@@ -57,12 +84,13 @@ def __instructions(
         args (str): Arguments to the class
         target (PathLike): Path to save.
         special (str): Any special treatment.
+        priority (str): Optional, higher runs first. Defaults to '0'.
 
     Raises:
         FileNotFoundError: If Target is invalid.
 
     Returns:
-        namedtuple[str, list[str], pathlib.Path, Any]: Args for class.
+        namedtuple[str, list[str], pathlib.Path, Any, int]: Args for class.
     """
 
     
@@ -79,7 +107,24 @@ def __instructions(
     if class_type != 'Custom':
         special = literal_eval(special)
 
-    return Instruction(class_type, args, target, special)
+    return Instruction(class_type, args, target, special, int(priority))
+
+def parse_instruction(line: str) -> Optional[Instruction]:
+    """Instruction of a DOWNLOAD= line, None for any other line.
+
+    Args:
+        line (str): A line of an instruction file.
+
+    Raises:
+        FileNotFoundError: If Target is invalid.
+
+    Returns:
+        Optional[Instruction]: The parsed instruction.
+    """
+    command, _, args = line.strip().partition('=')
+    if command != 'DOWNLOAD':
+        return None
+    return __instructions(*args.split('|'))
 
 with chdir(ABSPATH):
     
@@ -92,26 +137,14 @@ with chdir(ABSPATH):
         if not (ABSPATH / CONFIG_DIR / 'storage.json').is_file():
         # if True:
             HOME = ABSPATH
-            settings.update(HOME=ABSPATH)
+            settings.update(HOME=str(ABSPATH))
+            setting_file.seek(0)
             setting_file.truncate(0)
             json.dump(settings, setting_file, indent='\t')
         locals().update(settings)
-        storage_file, cred_file = map(
-            lambda x: ABSPATH / CONFIG_DIR / CRED_FILES.get(x), 
-            ['storage_file', 'cred_file']
-            )
-        store = file.Storage(storage_file)
-        creds = store.get()
-        if not creds or creds.invalid:
-            flow = client.flow_from_clientsecrets(cred_file, SCOPES)
-            creds = tools.run_flow(flow, store)
-        DRIVE = discovery.build('drive', 'v3', http=creds.authorize(Http()))
-        globals().update({'DRIVE': DRIVE})
-        
+
         for line in configs:
-            command, args = line.strip().split('=')
-            if command == 'DOWNLOAD':
-                args = args.split('|')
-                download_info = __instructions(*args)
+            download_info = parse_instruction(line)
+            if download_info is not None:
                 instruction_set.append(download_info)
 
@@ -0,0 +1,136 @@
+import json
+import random
+import socket
+import threading
+import time
+from typing import Callable, Optional, TypeVar
+
+from googleapiclient.errors import HttpError
+from httplib2 import HttpLib2Error
+
+from global_config import (API_BACKOFF_MAX_SECONDS, API_BACKOFF_SECONDS,
+                           API_QPS, API_RETRIES)
+from instrument import INSTRUMENTS
+from throttle import PRIORITY, TokenBucket
+
+# __all__ = ['Governor', 'GOVERNOR']
+
+T = TypeVar('T')
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+QUOTA_REASONS = {'userRateLimitExceeded', 'rateLimitExceeded'}
+TRANSIENT = (ConnectionError, TimeoutError, socket.timeout, HttpLib2Error)
+
+
+def _reason(error: HttpError) -> Optional[str]:
+    try:
+        return json.loads(error.content)['error']['errors'][0]['reason']
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+
+class Governor:
+    """
+    Rate limit and retry policy for every Drive request.
+    -----------------------------------------------------
+    args    -> qps         => float (requests per second, 0: unlimited),
+            -> retries     => int (attempts after the first),
+            -> backoff     => float (seconds before the first retry),
+            -> max_backoff => float (cap on a single wait)
+
+    -----------------------------------------------------
+    call(fn) waits for a token of a TokenBucket refilled
+    at the current rate, at the caller's PRIORITY, then
+    runs fn. 429, 5xx, 403 rate limit errors and dropped
+    connections are retried up to retries times, after
+    Retry-After when the server sent one, else after an
+    exponential backoff with full jitter.
+    The rate is adaptive (AIMD): every quota error (429
+    or 403 rate limit) halves it, down to a tenth of qps,
+    and every success adds qps / 100 back, up to qps.
+    """
+
+    def __init__(
+        self,
+        qps: float,
+        retries: int,
+        backoff: float,
+        max_backoff: float
+    ):
+        self.qps = qps
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.bucket = TokenBucket(qps, max(1, qps))
+        self._random = random.Random()
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+
+    def _adapt(self, quota_error: bool) -> None:
+        if not self.qps:
+            return
+        with self._lock:
+            if quota_error:
+                rate = max(self.qps / 10, self.rate / 2)
+            elif self.rate < self.qps:
+                rate = min(self.qps, self.rate + self.qps / 100)
+            else:
+                return
+            self.bucket.set_rate(rate)
+
+    def _delay(self, attempt: int, retry_after: Optional[str]) -> float:
+        if retry_after:
+            try:
+                return min(self.max_backoff, float(retry_after))
+            except ValueError:
+                # an HTTP date, rare enough to fall back to backoff
+                pass
+        ceiling = min(self.max_backoff, self.backoff * 2 ** attempt)
+        return self._random.uniform(0, ceiling)
+
+    def call(self, fn: Callable[[], T]) -> T:
+        """
+        Run fn under the rate limit, retrying transient errors.
+        -----------------------------------------------------
+        args    -> fn     => Callable[[], T]
+
+        returns -> result => T
+
+        -----------------------------------------------------
+        The last error is raised once retries are used up,
+        other errors are raised straight away.
+        """
+        attempt = 0
+        while True:
+            with INSTRUMENTS.timer('api.rate_limit'):
+                self.bucket.consume(1, PRIORITY.get())
+            try:
+                result = fn()
+            except HttpError as e:
+                status = e.resp.status
+                quota = status == 429 or (status == 403
+                                          and _reason(e) in QUOTA_REASONS)
+                if not quota and status not in RETRY_STATUS:
+                    raise
+                self._adapt(quota)
+                if attempt >= self.retries:
+                    raise
+                delay = self._delay(attempt, e.resp.get('retry-after'))
+            except TRANSIENT:
+                if attempt >= self.retries:
+                    raise
+                delay = self._delay(attempt, None)
+            else:
+                self._adapt(False)
+                return result
+            attempt += 1
+            INSTRUMENTS.count('api retries')
+            with INSTRUMENTS.timer('api.backoff'):
+                time.sleep(delay)
+
+
+GOVERNOR = Governor(API_QPS, API_RETRIES,
+                    API_BACKOFF_SECONDS, API_BACKOFF_MAX_SECONDS)
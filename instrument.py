@@ -0,0 +1,196 @@
+import atexit
+import contextlib
+import cProfile
+import json
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import ContextManager, Optional
+
+# __all__ = ['Histogram', 'Instruments', 'INSTRUMENTS']
+
+TRACE_MAX_EVENTS = 1_000_000
+_OFF = contextlib.nullcontext()
+
+
+class Histogram:
+    """
+    Latencies in power of two buckets of microseconds.
+    -----------------------------------------------------
+    quantile() is the upper bound of the bucket the
+    quantile falls in, so it is off by at most 2x, at a
+    constant cost per observation.
+    """
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float) -> None:
+        micros = seconds * 1e6
+        self.buckets[math.ceil(math.log2(micros)) if micros > 1 else 0] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """Seconds below which a fraction q of observations fall."""
+        rank, seen = q * self.count, 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return min(self.max, 2 ** bucket / 1e6)
+        return self.max
+
+
+class _Timer:
+    __slots__ = ('instruments', 'name', 'wall', 'cpu')
+
+    def __init__(self, instruments: 'Instruments', name: str):
+        self.instruments = instruments
+        self.name = name
+
+    def __enter__(self) -> '_Timer':
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.instruments._record(self.name, self.wall,
+                                 time.perf_counter() - self.wall,
+                                 time.thread_time() - self.cpu)
+
+
+class Instruments:
+    """
+    Registry of named timers and counters for the hot paths.
+    -----------------------------------------------------
+    timer(name) times a block in wall clock and in CPU time
+    of the calling thread, the difference being time spent
+    waiting (network, disk, locks), into a Histogram per
+    name; count(name, n) adds to a counter. Until start()
+    both return at once, timer() a shared no-op context.
+    start() prints summary() at exit and can also write a
+    cProfile of the whole run, every thread included, and
+    a Chrome trace (chrome://tracing, Perfetto) of every
+    timed block.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        self.cpu = Counter()
+        self.counters = Counter()
+        self.trace = None
+        self._threads = {}
+        self._local = threading.local()
+        self._profiles = []
+        self._lock = threading.Lock()
+
+    def timer(self, name: str) -> ContextManager:
+        if not self.enabled:
+            return _OFF
+        return _Timer(self, name)
+
+    def count(self, name: str, n: int = 1) -> None:
+        if self.enabled:
+            with self._lock:
+                self.counters[name] += n
+
+    def _record(self, name: str, began: float, wall: float,
+                cpu: float) -> None:
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(wall)
+            self.cpu[name] += cpu
+            if self.trace is not None and len(self.trace) < TRACE_MAX_EVENTS:
+                # OS thread ids are reused once a pool thread exits
+                tid = getattr(self._local, 'tid', None)
+                if tid is None:
+                    tid = self._local.tid = len(self._threads) + 1
+                    self._threads[tid] = threading.current_thread().name
+                self.trace.append({'name': name, 'ph': 'X',
+                                   'pid': os.getpid(), 'tid': tid,
+                                   'ts': began * 1e6, 'dur': wall * 1e6})
+
+    def _profile_thread(self, *_) -> None:
+        # the first event of a new thread: give it its own profiler,
+        # which replaces this hook for that thread
+        profile = cProfile.Profile()
+        profile.enable()
+        with self._lock:
+            self._profiles.append(profile)
+
+    def start(self, profile: Optional[str] = None,
+              trace: Optional[str] = None) -> None:
+        """
+        Enable every timer and counter until exit.
+        -----------------------------------------------------
+        args    -> profile => str / None (cProfile output file),
+                -> trace   => str / None (Chrome trace JSON file)
+        """
+        self.enabled = True
+        if trace:
+            self.trace = []
+        if profile:
+            main = cProfile.Profile()
+            main.enable()
+            self._profiles.append(main)
+            if sys.version_info < (3, 12):
+                # before 3.12 a profiler only sees its own thread
+                threading.setprofile(self._profile_thread)
+        atexit.register(self.stop, profile, trace)
+
+    def stop(self, profile: Optional[str] = None,
+             trace: Optional[str] = None) -> None:
+        """Write the profile and trace, then print summary()."""
+        if self._profiles:
+            import pstats
+
+            threading.setprofile(None)
+            for profiler in self._profiles:
+                profiler.disable()
+            stats = pstats.Stats(*self._profiles)
+            stats.dump_stats(profile)
+            print(f"cProfile written to {profile}")
+        if self.trace is not None:
+            with self._lock:
+                events = self.trace + [
+                    {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(),
+                     'tid': tid, 'args': {'name': name}}
+                    for tid, name in self._threads.items()
+                ]
+            with open(trace, 'w', encoding='utf-8') as f:
+                json.dump({'traceEvents': events}, f)
+            print(f"Chrome trace written to {trace}")
+        print(self.summary())
+        self.enabled = False
+
+    def summary(self) -> str:
+        """One line per timer, slowest total first, then counters."""
+        lines = [f"{'timer':<36} {'count':>8} {'total s':>9} {'cpu s':>8} "
+                 f"{'wait s':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8}"]
+        with self._lock:
+            histograms = sorted(self.histograms.items(),
+                                key=lambda item: -item[1].total)
+            for name, h in histograms:
+                cpu = self.cpu[name]
+                lines.append(
+                    f"{name:<36} {h.count:>8} {h.total:>9.3f} {cpu:>8.3f} "
+                    f"{max(0.0, h.total - cpu):>8.3f} "
+                    f"{h.quantile(0.5) * 1e3:>8.2f} "
+                    f"{h.quantile(0.95) * 1e3:>8.2f} {h.max * 1e3:>8.2f}"
+                )
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"{name:<36} {value:>8}")
+        return '\n'.join(lines)
+
+
+INSTRUMENTS = Instruments()
@@ -0,0 +1,140 @@
+import json
+import os
+import threading
+from typing import Optional
+
+from utils import PathLike
+
+# __all__ = ['JsonLines', 'Ledger']
+
+
+class JsonLines:
+    """
+    A file of JSON records, one per line, only ever appended.
+    -----------------------------------------------------
+    args    -> path => PathLike
+
+    -----------------------------------------------------
+    load() skips a torn last line left by a crash, and the
+    next append() terminates it first. Every append() is a
+    single O_APPEND write, so writers in several processes
+    never interleave; callers serialize their own threads.
+    """
+
+    def __init__(self, path: PathLike):
+        self.path = path
+        self._torn = False
+
+    def load(self) -> list[dict]:
+        records = []
+        if not os.path.isfile(self.path):
+            return records
+        line = '\n'
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        self._torn = not line.endswith('\n')
+        return records
+
+    def append(self, record: dict) -> None:
+        line = (json.dumps(record) + '\n').encode('utf-8')
+        if self._torn:
+            line, self._torn = b'\n' + line, False
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND,
+                     0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+class Ledger:
+    """
+    Index of the files successfully downloaded into a directory.
+    -----------------------------------------------------
+    args    -> path => PathLike (the target directory)
+
+    -----------------------------------------------------
+    Records live in <path>/success.jsonl, one JSON object
+    {"name", "size", "md5Checksum"} per line, and are held
+    in a dict keyed by exact name, so lookups are O(1).
+    Records are appended through JsonLines.
+    A directory with only the old success.txt is read from
+    it, and migrated on the first record(), so merely
+    checking never writes; success.txt itself is left
+    untouched.
+    Use Ledger.for_dir to share one instance per directory.
+    """
+    FILE = 'success.jsonl'
+    LEGACY_FILE = 'success.txt'
+
+    _ledgers = {}
+    _ledgers_lock = threading.Lock()
+
+    def __init__(self, path: PathLike):
+        self.path = os.path.abspath(path)
+        self.file = os.path.join(self.path, self.FILE)
+        self._lines = JsonLines(self.file)
+        self._lock = threading.Lock()
+        self._records = {}
+        self._legacy = False
+        if not os.path.isfile(self.file):
+            self._load_legacy()
+        for record in self._lines.load():
+            self._records[record['name']] = record
+
+    @classmethod
+    def for_dir(cls, path: PathLike) -> "Ledger":
+        """The shared Ledger of path, loaded on first use."""
+        key = os.path.abspath(path)
+        with cls._ledgers_lock:
+            ledger = cls._ledgers.get(key)
+            if ledger is None:
+                ledger = cls._ledgers[key] = cls(key)
+            return ledger
+
+    def _load_legacy(self) -> None:
+        legacy = os.path.join(self.path, self.LEGACY_FILE)
+        if not os.path.isfile(legacy):
+            return
+        with open(legacy, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    name = line.rstrip('\n')
+                    self._records[name] = {'name': name}
+        self._legacy = True
+
+    def _migrate(self) -> None:
+        """Write the records read from success.txt as success.jsonl."""
+        tmp = self.file + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            for record in self._records.values():
+                f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.file)
+
+    def get(self, name: str) -> Optional[dict]:
+        """Record of name, None if it was never completed."""
+        return self._records.get(name)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def record(self, name: str, size: int = None, md5: str = None) -> None:
+        """Mark name as completed, replacing any older record."""
+        record = {'name': name, 'size': size, 'md5Checksum': md5}
+        with self._lock:
+            if self._legacy:
+                os.makedirs(self.path, exist_ok=True)
+                self._migrate()
+                self._legacy = False
+            self._lines.append(record)
+            self._records[name] = record
@@ -0,0 +1,125 @@
+import re
+import unicodedata
+from collections import Counter
+from typing import NamedTuple, Optional
+
+from cache import CACHE
+from drive import FOLDER_MIME, execute, get_drive
+from global_config import MATCH_THRESHOLD, PAGE_SIZE
+
+# __all__ = ['normalize', 'folder_inventory', 'Match', 'FolderIndex']
+
+YEAR = re.compile(r'\b(1[89]\d\d|20\d\d)\b')
+
+
+def normalize(title: str) -> str:
+    """
+    Fold a title for matching.
+    -----------------------------------------------------
+    args    -> title => str
+
+    returns -> key   => str
+
+    -----------------------------------------------------
+    Accents are stripped ('La Vérité' -> 'la verite'),
+    case is folded and punctuation becomes single spaces.
+    """
+    title = unicodedata.normalize('NFKD', title)
+    title = ''.join(ch for ch in title if not unicodedata.combining(ch))
+    return ' '.join(re.sub(r'[\W_]+', ' ', title.casefold()).split())
+
+
+def trigrams(key: str) -> set[str]:
+    padded = f'  {key} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def folder_inventory() -> list[dict]:
+    """
+    Every folder in the Drive, listed once and cached.
+    -----------------------------------------------------
+    returns -> folders => list[dict] (id, name, parents)
+    """
+    folders = CACHE.get('inventory', 'folders')
+    if folders is not None:
+        return folders
+    folders = []
+    page_token = None
+    while True:
+        response = execute(get_drive().files().list(
+            q=f"mimeType = '{FOLDER_MIME}' and trashed = false",
+            corpora='user',
+            pageSize=PAGE_SIZE,
+            pageToken=page_token,
+            fields='nextPageToken, files(id, name, parents)',
+        ))
+        folders.extend(response.get('files', []))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            CACHE.put('inventory', 'folders', folders)
+            return folders
+
+
+class Match(NamedTuple):
+    title: str
+    folder: Optional[dict]
+    score: float
+
+
+class FolderIndex:
+    """
+    Trigram index over Drive folder names.
+    -----------------------------------------------------
+    args    -> folders => list[dict] (at least id and name)
+
+    -----------------------------------------------------
+    Names are normalized once and every trigram points to
+    the folders containing it. A title is scored against
+    the folders it shares trigrams with by Dice coefficient;
+    when both sides carry a year and the years differ, the
+    score is halved, so remakes do not pass for originals.
+    """
+
+    def __init__(self, folders: list[dict]):
+        self.folders = folders
+        keys = [normalize(folder['name']) for folder in folders]
+        self._grams = [trigrams(key) for key in keys]
+        self._years = [set(YEAR.findall(key)) for key in keys]
+        self._index = {}
+        for i, grams in enumerate(self._grams):
+            for gram in grams:
+                self._index.setdefault(gram, []).append(i)
+
+    def best(self, title: str) -> Match:
+        key = normalize(title)
+        grams = trigrams(key)
+        years = set(YEAR.findall(key))
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._index.get(gram, ()))
+
+        best, best_score = None, 0.0
+        for i, count in shared.items():
+            score = 2 * count / (len(grams) + len(self._grams[i]))
+            if years and self._years[i] and not years & self._years[i]:
+                score /= 2
+            if score > best_score:
+                best, best_score = self.folders[i], score
+        return Match(title, best, best_score)
+
+    def match(
+        self,
+        titles: list[str],
+        threshold: float = MATCH_THRESHOLD
+    ) -> list[Match]:
+        """
+        Best folder for every title in one pass over the index.
+        Titles scoring below threshold get folder None.
+        """
+        matches = []
+        for title in titles:
+            match = self.best(title)
+            if match.score < threshold:
+                match = match._replace(folder=None)
+            matches.append(match)
+        return matches
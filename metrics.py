@@ -0,0 +1,254 @@
+import json
+import math
+import os
+import threading
+import time
+from typing import Callable, Optional
+
+from global_config import (ABSPATH, DATA_DIR, METRICS_EWMA_SECONDS,
+                           METRICS_JSONL, METRICS_PROMETHEUS)
+from utils import bytes_to_MB, sec_to_hms
+
+# __all__ = ['Transfer', 'Metrics', 'JsonLinesSink', 'PrometheusTextfile',
+#            'TerminalProgress', 'METRICS']
+
+Event = dict
+Sink = Callable[[Event], None]
+
+
+class Transfer:
+    """
+    One file being downloaded, as seen by Metrics.
+    -----------------------------------------------------
+    args    -> metrics  => Metrics,
+            -> name     => str,
+            -> size     => int / None (bytes, None if unknown),
+            -> offset   => int (bytes already on disk),
+            -> progress => bool (show on the terminal)
+
+    -----------------------------------------------------
+    update(received) emits a 'chunk' event with the speed
+    as an EWMA with a time constant of METRICS_EWMA_SECONDS,
+    so it follows the current rate instead of the average
+    since start, and the ETA derived from it.
+    Used as a context manager, a transfer left without
+    finish() on exit is finished as failed.
+    """
+
+    def __init__(self, metrics: 'Metrics', name: str, size: Optional[int],
+                 offset: int = 0, progress: bool = False):
+        self.metrics = metrics
+        self.name = name
+        self.size = size
+        self.received = offset
+        self.progress = progress
+        self.speed = 0.0
+        self.done = False
+        self.started = self._stamp = time.monotonic()
+
+    def _event(self, kind: str, **extra) -> Event:
+        eta = None
+        if self.size is not None and self.speed > 0:
+            eta = max(0, self.size - self.received) / self.speed
+        return dict(event=kind, name=self.name, size=self.size,
+                    received=self.received, speed=self.speed, eta=eta,
+                    progress=self.progress, **extra)
+
+    def update(self, received: int) -> None:
+        """received: bytes of the file on disk so far."""
+        now = time.monotonic()
+        nbytes, seconds = received - self.received, now - self._stamp
+        if seconds > 0:
+            weight = 1 - math.exp(-seconds / METRICS_EWMA_SECONDS)
+            rate = nbytes / seconds
+            self.speed = (rate if self.speed == 0
+                          else self.speed + weight * (rate - self.speed))
+        self.received, self._stamp = received, now
+        self.metrics._chunk(self, nbytes)
+
+    def finish(self, ok: bool) -> bool:
+        """Emit the 'finish' event once, returns ok."""
+        if not self.done:
+            self.done = True
+            self.metrics._finish(self, ok)
+        return ok
+
+    def __enter__(self) -> 'Transfer':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.finish(False)
+
+
+class Metrics:
+    """
+    Transfer and API telemetry, fanned out to sinks.
+    -----------------------------------------------------
+    Every event is a flat dict with an 'event' key
+    ('start', 'chunk', 'finish' or 'api') and
+    is passed to each sink in turn, under a lock, together
+    with the totals over all transfers (see totals()).
+    """
+
+    def __init__(self, sinks: list[Sink] = ()):
+        self.sinks = list(sinks)
+        self.active = set()
+        self.bytes = 0
+        self.files = {'ok': 0, 'failed': 0}
+        self.api_calls = 0
+        self.api_seconds = 0.0
+        # sinks call totals() while an event holds the lock
+        self._lock = threading.RLock()
+
+    def totals(self) -> dict:
+        """Aggregates over all transfers, finished or not."""
+        with self._lock:
+            active = list(self.active)
+            return dict(
+                bytes=self.bytes,
+                active=len(active),
+                speed=sum(transfer.speed for transfer in active),
+                files_ok=self.files['ok'],
+                files_failed=self.files['failed'],
+                api_calls=self.api_calls,
+                api_seconds=self.api_seconds,
+            )
+
+    def transfers(self) -> list[Event]:
+        """State of every active transfer, as 'active' events."""
+        with self._lock:
+            return [transfer._event('active') for transfer in self.active]
+
+    def emit(self, event: Event) -> None:
+        event.setdefault('time', time.time())
+        for sink in self.sinks:
+            sink(event)
+
+    def start(self, name: str, size: Optional[int] = None,
+              offset: int = 0, progress: bool = False) -> Transfer:
+        transfer = Transfer(self, name, size, offset, progress)
+        with self._lock:
+            self.active.add(transfer)
+            self.emit(transfer._event('start'))
+        return transfer
+
+    def _chunk(self, transfer: Transfer, nbytes: int) -> None:
+        with self._lock:
+            self.bytes += nbytes
+            self.emit(transfer._event('chunk', bytes=nbytes))
+
+    def _finish(self, transfer: Transfer, ok: bool) -> None:
+        with self._lock:
+            self.active.discard(transfer)
+            self.files['ok' if ok else 'failed'] += 1
+            self.emit(transfer._event(
+                'finish', ok=ok, seconds=time.monotonic() - transfer.started
+            ))
+
+    def api_call(self, method: str, seconds: float) -> None:
+        with self._lock:
+            self.api_calls += 1
+            self.api_seconds += seconds
+            self.emit(dict(event='api', method=method, seconds=seconds))
+
+
+class JsonLinesSink:
+    """Append every event, with totals, as a JSON line to path."""
+
+    def __init__(self, path: os.PathLike, metrics: Metrics):
+        self.path = path
+        self.metrics = metrics
+
+    def __call__(self, event: Event) -> None:
+        line = json.dumps({**event, 'totals': self.metrics.totals()})
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(line + '\n')
+
+
+class PrometheusTextfile:
+    """
+    Keep the totals in a Prometheus textfile at path.
+    -----------------------------------------------------
+    The file is rewritten atomically after every 'finish'
+    and at most every interval seconds otherwise, for the
+    node_exporter textfile collector to pick up.
+    """
+
+    def __init__(self, path: os.PathLike, metrics: Metrics,
+                 interval: float = 1.0):
+        self.path = path
+        self.metrics = metrics
+        self.interval = interval
+        self._written = 0.0
+
+    def __call__(self, event: Event) -> None:
+        now = time.monotonic()
+        if event['event'] != 'finish' and now - self._written < self.interval:
+            return
+        self._written = now
+        totals = self.metrics.totals()
+        lines = [
+            ('bytes_total', 'counter', totals['bytes']),
+            ('active_transfers', 'gauge', totals['active']),
+            ('speed_bytes_per_second', 'gauge', totals['speed']),
+            ('files_total{status="ok"}', 'counter', totals['files_ok']),
+            ('files_total{status="failed"}', 'counter', totals['files_failed']),
+            ('api_calls_total', 'counter', totals['api_calls']),
+            ('api_latency_seconds_total', 'counter', totals['api_seconds']),
+        ]
+        text, typed = [], set()
+        for name, kind, value in lines:
+            base = name.split('{')[0]
+            if base not in typed:
+                text.append(f"# TYPE drivedownload_{base} {kind}")
+                typed.add(base)
+            text.append(f"drivedownload_{name} {value}")
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(text) + '\n')
+        os.replace(tmp, self.path)
+
+
+class TerminalProgress:
+    """
+    The single '\\r' progress line of a download, for
+    transfers started with progress=True.
+    """
+
+    def __call__(self, event: Event) -> None:
+        kind = event['event']
+        if kind == 'chunk' and event['progress']:
+            print('\r', end=self.line(event))
+        elif kind == 'finish' and event['progress']:
+            print()
+
+    @staticmethod
+    def line(event: Event) -> str:
+        received = bytes_to_MB(event['received'])
+        speed, unit = event['speed'] / 2**20, 'MBps'
+        if speed < 1:
+            speed, unit = speed * 1024, 'KBps'
+        if unit == 'KBps' and speed < 1:
+            speed, unit = speed * 1024, 'Bps'
+        eta = sec_to_hms(event['eta']) if event['eta'] is not None else '?'
+        if event['size']:
+            total = bytes_to_MB(event['size'])
+            done = (f" Downloaded: {received: .2f} MB / {total: .2f} MB "
+                    f"({received / total: .2%})")
+            remaining = f"Remaining: {total - received: .2f} MB"
+        else:
+            done, remaining = f" Downloaded: {received: .2f} MB", "Remaining: ?"
+        return ', '.join((
+            done, remaining,
+            f"ETA: {eta}, speed: {speed: .3f} {unit}                       "
+        ))
+
+
+METRICS = Metrics([TerminalProgress()])
+if METRICS_JSONL:
+    METRICS.sinks.append(JsonLinesSink(ABSPATH / DATA_DIR / METRICS_JSONL,
+                                       METRICS))
+if METRICS_PROMETHEUS:
+    METRICS.sinks.append(PrometheusTextfile(
+        ABSPATH / DATA_DIR / METRICS_PROMETHEUS, METRICS
+    ))
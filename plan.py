@@ -0,0 +1,199 @@
+import json
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+from typing import NamedTuple, Optional
+
+from engine import Job, size_of
+from global_config import ABSPATH, DATA_DIR, HISTORY_FILE
+from utils import PathLike, bytes_to_MB, sec_to_hms
+
+# __all__ = ['ACTIONS', 'PlanItem', 'Plan', 'ThroughputHistory', 'HISTORY']
+
+# what execution does with a file, in the order it does it
+ACTIONS = ('present', 'identical', 'place', 'download', 'copy')
+HISTORY_RUNS = 20
+
+
+def _mount_point(path: str) -> str:
+    """Mount point of the filesystem path is, or will be, on."""
+    path = os.path.dirname(os.path.abspath(path))
+    while not os.path.isdir(path):
+        path = os.path.dirname(path)
+    while not os.path.ismount(path):
+        path = os.path.dirname(path)
+    return path
+
+
+class PlanItem(NamedTuple):
+    job: Job
+    action: str
+    source: Optional[str] = None
+
+    @property
+    def size(self) -> int:
+        return size_of(self.job)
+
+    def to_dict(self) -> dict:
+        return {'file_id': self.job.file_id, 'name': self.job.name,
+                'path': self.job.path, 'size': self.size,
+                'instruction': self.job.instruction,
+                'priority': self.job.priority, 'action': self.action,
+                'source': self.source}
+
+
+class ThroughputHistory:
+    """
+    Bytes downloaded and wall time of past runs.
+    -----------------------------------------------------
+    args    -> path => PathLike (a JSON lines file)
+
+    -----------------------------------------------------
+    rate() is the throughput over the last HISTORY_RUNS
+    runs that downloaded anything, None before the first,
+    so it reflects the usual WORKERS, link and Drive
+    quota rather than a single file's speed.
+    """
+
+    def __init__(self, path: PathLike):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, nbytes: int, seconds: float, files: int) -> None:
+        if nbytes <= 0 or seconds <= 0:
+            return
+        line = json.dumps({'time': time.time(), 'bytes': nbytes,
+                           'seconds': seconds, 'files': files})
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+
+    def rate(self, runs: int = HISTORY_RUNS) -> Optional[float]:
+        """Bytes per second over the last runs, None without history."""
+        if not os.path.isfile(self.path):
+            return None
+        records = []
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+        records = records[-runs:]
+        seconds = sum(record['seconds'] for record in records)
+        if not seconds:
+            return None
+        return sum(record['bytes'] for record in records) / seconds
+
+
+class Plan:
+    """
+    Every file an instruction set resolves to, and what
+    executing it will do with each.
+    -----------------------------------------------------
+    args    -> items  => list[PlanItem],
+            -> errors => dict[str, str] (label -> error)
+
+    -----------------------------------------------------
+    An item is 'present' (in its Ledger), 'identical'
+    (on disk with Drive's checksum), 'place' (placed from
+    a local copy in the STORE), 'download' or 'copy' (a
+    duplicate placed from another item once downloaded).
+    Downloads are kept in the order the engine starts
+    them: higher priority first, then largest first, so
+    the big films do not leave the other workers idle at
+    the end of a run.
+    """
+
+    def __init__(self, items: list[PlanItem], errors: dict[str, str] = None):
+        self.items = items
+        self.errors = dict(errors or {})
+        self.created = time.time()
+
+    def by_action(self, action: str) -> list[PlanItem]:
+        return [item for item in self.items if item.action == action]
+
+    def totals(self) -> dict[str, dict[str, int]]:
+        """Files and bytes of each action."""
+        files, sizes = Counter(), Counter()
+        for item in self.items:
+            files[item.action] += 1
+            sizes[item.action] += item.size
+        return {action: {'files': files[action], 'bytes': sizes[action]}
+                for action in ACTIONS if files[action]}
+
+    def space(self) -> list[dict]:
+        """
+        Bytes still to be written to every filesystem the
+        downloads go to, against its free space.
+        -----------------------------------------------------
+        returns -> space => list of {'path', 'needed', 'free'}
+
+        -----------------------------------------------------
+        A .part left by an earlier run is preallocated to the
+        full size already, so it is not counted again; copies
+        may end up as reflinks or hardlinks and take nothing.
+        """
+        needed = Counter()
+        for item in self.items:
+            if item.action not in ('download', 'copy', 'place'):
+                continue
+            part = item.job.path + '.part'
+            size = item.size - (os.path.getsize(part)
+                                if os.path.isfile(part) else 0)
+            needed[_mount_point(item.job.path)] += max(0, size)
+        return [{'path': path, 'needed': needed[path],
+                 'free': shutil.disk_usage(path).free}
+                for path in needed]
+
+    def eta(self, rate: Optional[float]) -> Optional[float]:
+        """Seconds the downloads take at rate bytes per second."""
+        if not rate:
+            return None
+        return sum(item.size for item in self.by_action('download')) / rate
+
+    def save(self, path: PathLike, rate: Optional[float] = None) -> None:
+        """Write the plan as JSON, atomically."""
+        data = {
+            'created': self.created,
+            'totals': self.totals(),
+            'rate': rate,
+            'eta': self.eta(rate),
+            'space': self.space(),
+            'errors': self.errors,
+            'items': [item.to_dict() for item in self.items],
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent='\t')
+        os.replace(tmp, path)
+
+    def report(self, rate: Optional[float] = None) -> str:
+        """Totals, ETA and free space, for --dry-run."""
+        lines = []
+        for action, total in self.totals().items():
+            lines.append(f"{action:>9}: {total['files']:6} files "
+                         f"{bytes_to_MB(total['bytes']):12.2f} MB")
+        if rate:
+            lines.append(f"      ETA: {sec_to_hms(self.eta(rate))} at "
+                         f"{bytes_to_MB(rate):.2f} MB/s (past runs)")
+        else:
+            lines.append("      ETA: ? (no past runs to go by)")
+        for space in self.space():
+            short = space['needed'] - space['free']
+            verdict = (f"short by {bytes_to_MB(short):.2f} MB" if short > 0
+                       else "fits")
+            lines.append(f"    space: {bytes_to_MB(space['needed']):.2f} MB "
+                         f"needed on {space['path']}, "
+                         f"{bytes_to_MB(space['free']):.2f} MB free, "
+                         f"{verdict}")
+        for label, error in self.errors.items():
+            lines.append(f"   failed: {label}: {error}")
+        return '\n'.join(lines)
+
+
+HISTORY = ThroughputHistory(ABSPATH / DATA_DIR / HISTORY_FILE)
@@ -0,0 +1,129 @@
+from typing import NamedTuple, Optional
+
+from cache import CACHE
+from drive import FOLDER_MIME, META_FIELDS, execute, get_drive
+from global_config import RESOLVE_NAMES_PER_QUERY
+
+# __all__ = ['Resolution', 'resolve_names']
+
+BATCH_LIMIT = 100
+
+
+class Resolution(NamedTuple):
+    found: dict
+    missing: list
+    ambiguous: dict
+
+
+def _quote(name: str) -> str:
+    return name.replace('\\', '\\\\').replace("'", "\\'")
+
+
+def _query(names: list[str], parent: Optional[str], folders: bool) -> str:
+    query = ' or '.join(f"name = '{_quote(name)}'" for name in names)
+    query = f"({query}) and trashed = false"
+    if folders:
+        query += f" and mimeType = '{FOLDER_MIME}'"
+    if parent:
+        query += f" and '{parent}' in parents"
+    return query
+
+
+def _list_batched(queries: list[str]) -> list[list[dict]]:
+    """
+    Run files().list for every query, up to BATCH_LIMIT per
+    batch request; pages beyond the first are fetched one
+    by one.
+    """
+    drive = get_drive()
+    results = [[] for _ in queries]
+    tokens = {}
+
+    def request(index, page_token=None):
+        return drive.files().list(
+            q=queries[index],
+            corpora='user',
+            pageSize=1000,
+            pageToken=page_token,
+            fields=f'nextPageToken, files({META_FIELDS})',
+        )
+
+    def collect(request_id, response, exception):
+        if exception is not None:
+            raise exception
+        # assigned, not appended: a batch retried by the
+        # governor delivers its first pages again
+        index = int(request_id)
+        results[index] = list(response.get('files', []))
+        if response.get('nextPageToken'):
+            tokens[index] = response['nextPageToken']
+
+    for start in range(0, len(queries), BATCH_LIMIT):
+        batch = drive.new_batch_http_request(callback=collect)
+        for index in range(start, min(start + BATCH_LIMIT, len(queries))):
+            batch.add(request(index), request_id=str(index))
+        execute(batch)
+
+    for index, page_token in tokens.items():
+        while page_token:
+            response = execute(request(index, page_token))
+            results[index].extend(response.get('files', []))
+            page_token = response.get('nextPageToken')
+    return results
+
+
+def resolve_names(
+    names: list[str],
+    parent: Optional[str] = None,
+    folders: bool = False,
+) -> Resolution:
+    """
+    Resolve many names to Drive metadata in a few round trips.
+    -----------------------------------------------------
+    args    -> names   => list[str],
+            -> parent  => str / None (restrict to this folder id),
+            -> folders => bool (only match folders)
+
+    returns -> Resolution(found, missing, ambiguous)
+
+    -----------------------------------------------------
+    Names not in the metadata cache are OR-ed together,
+    RESOLVE_NAMES_PER_QUERY per files().list query, and
+    the queries are sent as batch requests. Matches are
+    mapped back to their input by name. found maps name
+    to its metadata; a name with several matches is also
+    listed in ambiguous with all of them and, like
+    get_file, resolves to the first.
+    """
+    names = list(dict.fromkeys(names))
+    found, ambiguous = {}, {}
+    kind = 'folder' if folders else 'file'
+    key = lambda name: f"{parent or ''}/{name}"
+
+    todo = []
+    for name in names:
+        meta = CACHE.get(kind, key(name))
+        if meta is None:
+            todo.append(name)
+        else:
+            found[name] = meta
+
+    chunks = [todo[i:i + RESOLVE_NAMES_PER_QUERY]
+              for i in range(0, len(todo), RESOLVE_NAMES_PER_QUERY)]
+    listings = _list_batched([_query(chunk, parent, folders)
+                              for chunk in chunks]) if chunks else []
+    for chunk, listing in zip(chunks, listings):
+        by_name = {}
+        for meta in listing:
+            by_name.setdefault(meta['name'].casefold(), []).append(meta)
+        for name in chunk:
+            matches = by_name.get(name.casefold(), [])
+            if not matches:
+                continue
+            if len(matches) > 1:
+                ambiguous[name] = matches
+            found[name] = matches[0]
+            CACHE.put(kind, key(name), matches[0])
+
+    missing = [name for name in names if name not in found]
+    return Resolution(found, missing, ambiguous)
@@ -0,0 +1,162 @@
+import os
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from typing import Optional
+
+from global_config import ABSPATH, DATA_DIR, DEDUP, STORE_FILE
+from ledger import JsonLines
+from utils import PathLike
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# __all__ = ['ContentStore', 'STORE']
+
+# from linux/fs.h
+FICLONE = 0x40049409
+MODES = {
+    'auto': ('reflink', 'hardlink', 'copy'),
+    'reflink': ('reflink', 'copy'),
+    'hardlink': ('hardlink', 'copy'),
+    'copy': ('copy',),
+    'off': ('copy',),
+}
+
+
+def _reflink(source: str, dest: str) -> None:
+    if fcntl is None:
+        raise OSError("reflink needs fcntl")
+    with open(source, 'rb') as src, open(dest, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+
+class ContentStore:
+    """
+    Local copies of Drive files, by content.
+    -----------------------------------------------------
+    args    -> path => PathLike (the index file),
+            -> mode => str (one of MODES, default: DEDUP)
+
+    -----------------------------------------------------
+    A completed download is indexed under its Drive
+    (md5Checksum, size) in a JsonLines file. find()
+    returns a copy that still has the size and mtime it
+    had when indexed; place() puts
+    that copy at another path as a reflink, a hardlink or
+    a plain copy, the first of MODES[mode] that works, and
+    counts the bytes not downloaded. With mode 'off'
+    nothing is indexed and find() never matches.
+    """
+
+    def __init__(self, path: PathLike, mode: str = DEDUP):
+        if mode not in MODES:
+            raise ValueError(f"DEDUP must be one of {tuple(MODES)}")
+        self.path = path
+        self._lines = JsonLines(path)
+        self.mode = mode
+        self.saved = 0
+        self.placed = Counter()
+        self._copies = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    @staticmethod
+    def key(meta: Optional[dict]) -> Optional[tuple[str, int]]:
+        """(md5Checksum, size) of meta, None if it lacks either."""
+        meta = meta or {}
+        if not meta.get('md5Checksum') or meta.get('size') is None:
+            return None
+        return meta['md5Checksum'], int(meta['size'])
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        for record in self._lines.load():
+            key = (record['md5Checksum'], record['size'])
+            self._copies.setdefault(key, {})[record['path']] = \
+                record['mtime_ns']
+
+    def find(self, meta: Optional[dict]) -> Optional[str]:
+        """Path of an unchanged local copy of meta's content, if any."""
+        key = self.key(meta)
+        if self.mode == 'off' or key is None:
+            return None
+        with self._lock:
+            self._load()
+            copies = list(self._copies.get(key, {}).items())
+        for path, mtime_ns in reversed(copies):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if stat.st_size == key[1] and stat.st_mtime_ns == mtime_ns:
+                return path
+        return None
+
+    def add(self, meta: Optional[dict], path: PathLike) -> None:
+        """Index the completed file at path as meta's content."""
+        key = self.key(meta)
+        if self.mode == 'off' or key is None:
+            return
+        path = os.path.abspath(path)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return
+        record = {'md5Checksum': key[0], 'size': key[1], 'path': path,
+                  'mtime_ns': mtime_ns}
+        with self._lock:
+            self._load()
+            self._lines.append(record)
+            self._copies.setdefault(key, {})[path] = mtime_ns
+
+    def place(self, source: str, dest: str, size: int = 0) -> str:
+        """
+        Put the content of source at dest, counting size
+        bytes as saved.
+        -----------------------------------------------------
+        args    -> source => str,
+                -> dest   => str,
+                -> size   => int
+
+        returns -> method => str ('reflink', 'hardlink' or 'copy')
+
+        -----------------------------------------------------
+        dest is replaced atomically from a .place.tmp file of
+        its own, never the .part of a resumable download;
+        raises the OSError of the last method when none works.
+        """
+        fd, tmp = tempfile.mkstemp(
+            prefix=f'.{os.path.basename(dest)}.', suffix='.place.tmp',
+            dir=os.path.dirname(dest) or '.'
+        )
+        os.close(fd)
+        for method in MODES[self.mode]:
+            if os.path.lexists(tmp):
+                os.remove(tmp)
+            try:
+                if method == 'reflink':
+                    _reflink(source, tmp)
+                elif method == 'hardlink':
+                    os.link(source, tmp)
+                else:
+                    shutil.copyfile(source, tmp)
+            except OSError:
+                if os.path.lexists(tmp):
+                    os.remove(tmp)
+                if method == MODES[self.mode][-1]:
+                    raise
+                continue
+            os.replace(tmp, dest)
+            with self._lock:
+                self.saved += size
+                self.placed[method] += 1
+            return method
+
+
+STORE = ContentStore(ABSPATH / DATA_DIR / STORE_FILE)
@@ -0,0 +1,81 @@
+import contextvars
+import json
+import threading
+import time
+from collections import Counter
+
+from global_config import BANDWIDTH_BURST_MB, BANDWIDTH_LIMIT_MBPS, SETTING
+
+# __all__ = ['PRIORITY', 'TokenBucket', 'BANDWIDTH', 'reload_limit']
+
+PRIORITY = contextvars.ContextVar('priority', default=0)
+
+
+class TokenBucket:
+    """
+    Bandwidth limit shared by every transfer.
+    -----------------------------------------------------
+    args    -> rate  => float (bytes per second, 0: unlimited),
+            -> burst => float (bytes)
+
+    -----------------------------------------------------
+    consume(n) blocks until n bytes may be transferred.
+    A caller may overdraw the bucket, the debt is then paid
+    by whoever comes next, so requests bigger than burst
+    still average out to rate. While a caller of higher
+    priority is waiting, lower priorities wait behind it
+    and only get the capacity it leaves over.
+    The rate can be changed at any time with set_rate.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._stamp = time.monotonic()
+        self._waiting = Counter()
+        self._cond = threading.Condition()
+
+    def set_rate(self, rate: float) -> None:
+        with self._cond:
+            self._refill()
+            self.rate = rate
+            self._cond.notify_all()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.rate > 0:
+            self._tokens = min(self.burst,
+                               self._tokens + (now - self._stamp) * self.rate)
+        self._stamp = now
+
+    def _outranked(self, priority: int) -> bool:
+        return any(p > priority and count
+                   for p, count in self._waiting.items())
+
+    def consume(self, n: int, priority: int = 0) -> None:
+        with self._cond:
+            self._waiting[priority] += 1
+            try:
+                while self.rate > 0:
+                    self._refill()
+                    if self._tokens > 0 and not self._outranked(priority):
+                        self._tokens -= n
+                        break
+                    deficit = max(-self._tokens, 0) + 1
+                    self._cond.wait(min(1.0, deficit / self.rate))
+            finally:
+                self._waiting[priority] -= 1
+                self._cond.notify_all()
+
+
+BANDWIDTH = TokenBucket(BANDWIDTH_LIMIT_MBPS * 2**20,
+                        BANDWIDTH_BURST_MB * 2**20)
+
+
+def reload_limit(*_) -> None:
+    """Re-read BANDWIDTH_LIMIT_MBPS from the settings file."""
+    with open(SETTING) as setting_file:
+        limit = json.load(setting_file).get('BANDWIDTH_LIMIT_MBPS', 0)
+    BANDWIDTH.set_rate(limit * 2**20)
+    print(f"Bandwidth limit: {limit or 'unlimited'} MB/s")
@@ -0,0 +1,368 @@
+import contextlib
+import errno
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, ContextManager, Iterator, Optional
+
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaDownloadProgress
+from httplib2 import Http
+
+from instrument import INSTRUMENTS
+
+# __all__ = ['split_ranges', 'pwrite_all', 'preallocate', 'MemoryBudget',
+#            'ChunkSizer', 'PartialFile', 'ranged_download']
+
+FSYNC_POLICIES = ('none', 'finish', 'checkpoint')
+
+
+def split_ranges(size: int, parts: int) -> list[tuple[int, int]]:
+    """
+    Split size bytes into at most parts disjoint spans.
+    -----------------------------------------------------
+    args    -> size   => int,
+            -> parts  => int
+
+    returns -> spans  => list[tuple[int, int]]
+
+    -----------------------------------------------------
+    Spans are inclusive (start, end) pairs, as used in
+    HTTP Range headers.
+    """
+    if size <= 0:
+        return []
+    step = -(-size // max(1, parts))
+    return [(start, min(start + step, size) - 1)
+            for start in range(0, size, step)]
+
+
+def pwrite_all(fd: int, data, offset: int) -> int:
+    """
+    Write all of data at offset, without moving fd's position.
+    -----------------------------------------------------
+    args    -> fd     => int,
+            -> data   => bytes-like,
+            -> offset => int
+
+    returns -> nbytes => int
+
+    -----------------------------------------------------
+    os.pwrite may write less than asked; the rest is
+    written from a memoryview of data, never a copy.
+    """
+    view = memoryview(data)
+    total = view.nbytes
+    written = 0
+    with INSTRUMENTS.timer('disk.write'):
+        while written < total:
+            written += os.pwrite(fd, view[written:], offset + written)
+    INSTRUMENTS.count('bytes written', total)
+    return total
+
+
+def preallocate(fd: int, size: int) -> None:
+    """
+    Reserve size bytes for fd before anything is downloaded.
+    -----------------------------------------------------
+    args    -> fd   => int,
+            -> size => int
+
+    -----------------------------------------------------
+    Raises OSError(ENOSPC) straight away when the disk has
+    less free space than the file still needs. The blocks
+    are allocated in one go with posix_fallocate, which
+    keeps a large file contiguous; where the filesystem
+    cannot do that the file is only extended to size.
+    """
+    stat = os.fstat(fd)
+    needed = size - stat.st_blocks * 512
+    vfs = os.fstatvfs(fd)
+    free = vfs.f_bavail * vfs.f_frsize
+    if needed > free:
+        raise OSError(errno.ENOSPC,
+                      f"{needed / 2**20:.1f} MB needed, "
+                      f"{free / 2**20:.1f} MB free")
+    if size <= stat.st_size:
+        return
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError as e:
+            if e.errno == errno.ENOSPC:
+                raise
+    os.ftruncate(fd, size)
+
+
+class MemoryBudget:
+    """
+    Bytes of chunk data all transfers may hold at once.
+    -----------------------------------------------------
+    args    -> total => int (bytes)
+
+    -----------------------------------------------------
+    A chunk is held from before its request until it has
+    been written; hold() blocks while the budget is spent.
+    """
+
+    def __init__(self, total: int):
+        self.total = total
+        self._free = total
+        self._cond = threading.Condition()
+
+    @contextlib.contextmanager
+    def hold(self, nbytes: int) -> Iterator[None]:
+        nbytes = min(nbytes, self.total)
+        with self._cond:
+            self._cond.wait_for(lambda: self._free >= nbytes)
+            self._free -= nbytes
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._free += nbytes
+                self._cond.notify_all()
+
+
+class ChunkSizer:
+    """
+    Chunk size of one transfer, adapted to the link.
+    -----------------------------------------------------
+    args    -> minimum => int (bytes),
+            -> maximum => int (bytes),
+            -> target  => float (seconds per chunk)
+
+    -----------------------------------------------------
+    observe() feeds back how long each chunk took. The
+    fastest rate seen stands in for the line rate, and the
+    time beyond bytes / line rate is taken as per-request
+    latency (EWMA). The next chunk is sized to last about
+    target seconds, and never so small that latency costs
+    more than a tenth of it.
+    """
+    SMOOTHING = 0.3
+
+    def __init__(self, minimum: int, maximum: int, target: float):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.target = target
+        self.rate = 0.0
+        self.latency = 0.0
+        self.size = minimum
+
+    def observe(self, nbytes: int, seconds: float) -> None:
+        if nbytes <= 0 or seconds <= 0:
+            return
+        self.rate = max(self.rate, nbytes / seconds)
+        latency = max(0.0, seconds - nbytes / self.rate)
+        self.latency += self.SMOOTHING * (latency - self.latency)
+        size = max(self.rate * self.target, 9 * self.latency * self.rate)
+        # grow at most 4x per chunk, the rate estimate is still young
+        size = min(size, 4 * max(nbytes, self.size))
+        self.size = int(min(self.maximum, max(self.minimum, size)))
+
+
+class PartialFile:
+    """
+    A download in progress, kept as <file_name>.part.
+    -----------------------------------------------------
+    args    -> file_name => str (final path),
+            -> meta      => dict (Drive metadata of the file),
+            -> fsync     => str (one of FSYNC_POLICIES, default: 'finish')
+
+    -----------------------------------------------------
+    A JSON sidecar <file_name>.part.json records the
+    remote id, size, md5Checksum and modifiedTime along
+    with every span as [start, end, next_offset]. Bytes
+    are always written before the sidecar claims them,
+    so a resumed download never trusts unwritten data.
+    fsync decides what is flushed to disk: nothing
+    ('none'), the finished file before it is moved into
+    place ('finish'), or also the data before every
+    checkpoint ('checkpoint'), which survives power loss
+    at the price of a flush per chunk.
+    """
+    KEYS = ('id', 'size', 'md5Checksum', 'modifiedTime')
+
+    def __init__(self, file_name: str, meta: dict, fsync: str = 'finish'):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}")
+        self.file_name = file_name
+        self.path = file_name + '.part'
+        self.sidecar = file_name + '.part.json'
+        self.remote = {key: meta.get(key) for key in self.KEYS}
+        self.fsync = fsync
+        self._lock = threading.Lock()
+
+    def open(self) -> int:
+        """
+        File descriptor of the .part, read-write and
+        preallocated to the remote size, see preallocate.
+        """
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            preallocate(fd, int(self.remote['size'] or 0))
+        except BaseException:
+            os.close(fd)
+            raise
+        return fd
+
+    def spans(self, default: list[tuple[int, int]]) -> list[list[int]]:
+        """
+        Spans to fetch, resumed from the sidecar when the
+        remote file is unchanged, else a fresh default.
+        """
+        try:
+            with open(self.sidecar) as f:
+                state = json.load(f)
+            if (state.get('remote') == self.remote
+                    and os.path.isfile(self.path)):
+                return state['spans']
+        except (OSError, ValueError, KeyError):
+            pass
+        self.discard()
+        spans = [[start, end, start] for start, end in default]
+        self.checkpoint(spans)
+        return spans
+
+    @staticmethod
+    def received(spans: list[list[int]]) -> int:
+        return sum(offset - start for start, _, offset in spans)
+
+    def checkpoint(self, spans: list[list[int]], fd: int = None) -> None:
+        """
+        Atomically rewrite the sidecar with spans, flushing
+        the data of fd first under the 'checkpoint' policy.
+        """
+        with INSTRUMENTS.timer('disk.checkpoint'):
+            if self.fsync == 'checkpoint' and fd is not None:
+                os.fdatasync(fd)
+            with self._lock:
+                tmp = self.sidecar + '.tmp'
+                with open(tmp, 'w') as f:
+                    json.dump({'remote': self.remote, 'spans': spans}, f)
+                os.replace(tmp, self.sidecar)
+
+    def finish(self) -> None:
+        """Move the completed .part into place."""
+        if self.fsync != 'none':
+            fd = os.open(self.path, os.O_RDONLY)
+            try:
+                with INSTRUMENTS.timer('disk.fsync'):
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+        os.replace(self.path, self.file_name)
+        os.remove(self.sidecar)
+
+    def discard(self) -> None:
+        for path in (self.path, self.sidecar):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def ranged_download(
+    uri: str,
+    partial: PartialFile,
+    size: int,
+    connection: Callable[[], ContextManager[Http]],
+    parts: int = 4,
+    block_size: int = 32 * 2**20,
+    cancel: Optional[threading.Event] = None,
+    progress: Optional[Callable[[MediaDownloadProgress], None]] = None,
+    throttle: Optional[Callable[[int], None]] = None,
+    budget: Optional[MemoryBudget] = None,
+    retry: Optional[Callable[[Callable[[], Any]], Any]] = None,
+) -> bool:
+    """
+    Download uri into partial over several connections.
+    -----------------------------------------------------
+    args    -> uri          => str (a get_media uri),
+            -> partial      => PartialFile,
+            -> size         => int (total bytes),
+            -> connection   => Callable returning a context
+                               manager that yields an Http,
+            -> parts        => int (default: 4),
+            -> block_size   => int (default: 32 MB),
+            -> cancel       => threading.Event / None,
+            -> progress     => Callable / None,
+            -> throttle     => Callable(nbytes) / None,
+            -> budget       => MemoryBudget / None,
+            -> retry        => Callable(fn) -> fn() / None
+
+    returns -> complete     => bool
+
+    -----------------------------------------------------
+    The file is cut into parts spans which are fetched at
+    the same time, each span as a series of Range requests
+    of block_size bytes written straight to their offset.
+    Spans left over from an earlier run of the same remote
+    file continue from their last checkpoint. The caller
+    verifies and finishes partial once this returns True.
+    throttle is called with the size of every block before
+    it is requested, and the block is held against budget
+    until it is written. Every Range request is made
+    through retry when given, which may call it again.
+    Every span holds a connection() for as long as it
+    runs, on its own thread, so the Http it yields must
+    not be in use anywhere else meanwhile.
+    """
+    spans = partial.spans(split_ranges(size, parts))
+    stop = threading.Event()
+    lock = threading.Lock()
+    received = partial.received(spans)
+
+    def fetch_span(fd: int, span: list[int]) -> None:
+        nonlocal received
+        with connection() as http:
+            _, end, offset = span
+            while offset <= end:
+                if stop.is_set() or (cancel is not None and cancel.is_set()):
+                    raise KeyboardInterrupt
+                last = min(offset + block_size, end + 1) - 1
+                if throttle is not None:
+                    throttle(last - offset + 1)
+                with (budget.hold(last - offset + 1) if budget is not None
+                      else contextlib.nullcontext()):
+                    def get_block() -> bytes:
+                        with INSTRUMENTS.timer('chunk.fetch'):
+                            resp, content = http.request(
+                                uri, 'GET',
+                                headers={'range': f'bytes={offset}-{last}'}
+                            )
+                        INSTRUMENTS.count('bytes fetched', len(content))
+                        if not content or resp.status not in (200, 206) or (
+                            resp.status == 200
+                            and (offset, last) != (0, size - 1)
+                        ):
+                            raise HttpError(resp, content, uri=uri)
+                        return content
+
+                    content = (retry(get_block) if retry is not None
+                               else get_block())
+                    nbytes = pwrite_all(fd, content, offset)
+                    del content
+                offset += nbytes
+                with lock:
+                    span[2] = offset
+                    received += nbytes
+                    partial.checkpoint(spans, fd)
+                    if progress is not None:
+                        progress(MediaDownloadProgress(received, size))
+
+    fd = partial.open()
+    try:
+        with ThreadPoolExecutor(len(spans) or 1,
+                                thread_name_prefix='span') as pool:
+            futures = [pool.submit(fetch_span, fd, span) for span in spans]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                stop.set()
+                raise
+    finally:
+        os.close(fd)
+    return received == size
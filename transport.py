@@ -0,0 +1,143 @@
+import contextlib
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Iterator, Optional
+
+from googleapiclient.errors import HttpError
+from httplib2 import Http
+
+from instrument import INSTRUMENTS
+
+if TYPE_CHECKING:
+    from oauth2client.client import Credentials
+
+# __all__ = ['Token', 'PooledHttp', 'ConnectionPool']
+
+
+class Token:
+    """
+    The one access token every connection sends.
+    -----------------------------------------------------
+    args    -> credentials => Callable returning the Credentials
+
+    -----------------------------------------------------
+    header() refreshes the token when it has expired, or
+    when the caller saw it rejected, under a lock, so a
+    burst of 401s from many connections costs a single
+    refresh.
+    """
+
+    def __init__(self, credentials: Callable[[], "Credentials"]):
+        self.credentials = credentials
+        self._lock = threading.Lock()
+
+    def header(self, rejected: Optional[str] = None) -> str:
+        """Authorization header value; rejected is the one that got a 401."""
+        with self._lock:
+            creds = self.credentials()
+            current = f'Bearer {creds.access_token}'
+            if (creds.access_token is None or creds.access_token_expired
+                    or current == rejected):
+                creds.refresh(Http())
+                current = f'Bearer {creds.access_token}'
+            return current
+
+
+class PooledHttp(Http):
+    """
+    httplib2.Http sending the shared Token (None: no auth).
+    A 401 refreshes the token once and retries the request.
+    """
+
+    def __init__(self, token: Optional[Token] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.token = token
+        self.last_used = time.monotonic()
+
+    def request(self, uri, method='GET', body=None, headers=None, *args,
+                **kwargs):
+        if self.token is None:
+            return super().request(uri, method, body, headers, *args, **kwargs)
+        headers = dict(headers or {})
+        headers['authorization'] = self.token.header()
+        resp, content = super().request(uri, method, body, headers,
+                                        *args, **kwargs)
+        if resp.status == 401:
+            headers['authorization'] = self.token.header(
+                rejected=headers['authorization']
+            )
+            resp, content = super().request(uri, method, body, headers,
+                                            *args, **kwargs)
+        return resp, content
+
+
+class ConnectionPool:
+    """
+    A bounded set of keep-alive connections.
+    -----------------------------------------------------
+    args    -> factory      => Callable returning a PooledHttp,
+            -> size         => int (connections at most),
+            -> idle_timeout => float (seconds an idle one is kept)
+
+    -----------------------------------------------------
+    checkout() hands a thread the most recently returned
+    connection, whose TLS session is the likeliest to be
+    alive, and blocks while size are out. Connections idle
+    longer than idle_timeout are closed instead of reused,
+    before the server drops them. A connection that saw
+    anything but a complete HTTP response is closed on
+    return, its socket state is unknown.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], PooledHttp],
+        size: int,
+        idle_timeout: float
+    ):
+        self.factory = factory
+        self.size = max(1, int(size))
+        self.idle_timeout = idle_timeout
+        self._idle = []
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+
+    def checkout(self) -> PooledHttp:
+        with INSTRUMENTS.timer('http.checkout'):
+            self._slots.acquire()
+        try:
+            now = time.monotonic()
+            with self._lock:
+                while self._idle:
+                    http = self._idle.pop()
+                    if now - http.last_used <= self.idle_timeout:
+                        return http
+                    http.close()
+            return self.factory()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def checkin(self, http: PooledHttp, broken: bool = False) -> None:
+        if broken:
+            http.close()
+        else:
+            http.last_used = time.monotonic()
+            with self._lock:
+                self._idle.append(http)
+        self._slots.release()
+
+    @contextlib.contextmanager
+    def connection(self) -> Iterator[PooledHttp]:
+        """checkout() for the duration of the block."""
+        http = self.checkout()
+        try:
+            yield http
+        except HttpError:
+            self.checkin(http)
+            raise
+        except BaseException:
+            self.checkin(http, broken=True)
+            raise
+        else:
+            self.checkin(http)
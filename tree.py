@@ -0,0 +1,113 @@
+import contextvars
+import posixpath
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from cache import CACHE
+from drive import FOLDER_MIME, META_FIELDS, execute, get_drive
+from global_config import LIST_WORKERS, PAGE_SIZE
+
+# __all__ = ['list_children', 'walk', 'walk_all']
+
+
+def list_children(folder_id: str) -> list[dict]:
+    """
+    Every child of a folder, following nextPageToken.
+    -----------------------------------------------------
+    args    -> folder_id => str
+
+    returns -> children  => list[dict] (META_FIELDS)
+
+    -----------------------------------------------------
+    Served from the metadata cache while it is fresh.
+    """
+    children = CACHE.get('children', folder_id)
+    if children is not None:
+        return children
+    children = []
+    page_token = None
+    while True:
+        response = execute(get_drive().files().list(
+            q=f"'{folder_id}' in parents and trashed = false",
+            corpora='user',
+            pageSize=PAGE_SIZE,
+            pageToken=page_token,
+            fields=f'nextPageToken, files({META_FIELDS})',
+        ))
+        children.extend(response.get('files', []))
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            CACHE.put('children', folder_id, children)
+            return children
+
+
+def walk(folder_id: str, workers: int = LIST_WORKERS) -> list[tuple[str, dict]]:
+    """
+    Enumerate the whole tree under folder_id.
+    -----------------------------------------------------
+    args    -> folder_id => str,
+            -> workers   => int (default: LIST_WORKERS)
+
+    returns -> files     => list[tuple[str, dict]]
+
+    -----------------------------------------------------
+    Returns (relative_dir, metadata) for every non-folder
+    below folder_id, relative_dir being '' for its direct
+    children. See walk_all().
+    """
+    trees, errors = walk_all([folder_id], workers)
+    if folder_id in errors:
+        raise errors[folder_id]
+    return trees[folder_id]
+
+
+def walk_all(
+    folder_ids: list[str],
+    workers: int = LIST_WORKERS
+) -> tuple[dict[str, list[tuple[str, dict]]], dict[str, Exception]]:
+    """
+    Enumerate the trees under several folders at once.
+    -----------------------------------------------------
+    args    -> folder_ids => list[str],
+            -> workers    => int (default: LIST_WORKERS)
+
+    returns -> (trees, errors) => (folder_id -> files,
+                                   folder_id -> exception)
+
+    -----------------------------------------------------
+    files are as returned by walk(). Every folder of every
+    tree shares one pool of at most workers threads, so
+    the siblings of all roots are listed at the same time.
+    A root whose listing fails is in errors, not trees,
+    and does not stop the others.
+    """
+    trees = {folder_id: [] for folder_id in folder_ids}
+    errors = {}
+    with ThreadPoolExecutor(max(1, workers),
+                            thread_name_prefix='walk') as pool:
+        def submit(root: str, fid: str, rel: str):
+            context = contextvars.copy_context()
+            future = pool.submit(context.run, list_children, fid)
+            pending[future] = root, rel
+
+        pending = {}
+        for folder_id in trees:
+            submit(folder_id, folder_id, '')
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                root, rel = pending.pop(future)
+                if root in errors:
+                    continue
+                try:
+                    children = future.result()
+                except Exception as e:
+                    errors[root] = e
+                    del trees[root]
+                    continue
+                for child in children:
+                    if child.get('mimeType') == FOLDER_MIME:
+                        submit(root, child['id'],
+                               posixpath.join(rel, child['name']))
+                    else:
+                        trees[root].append((rel, child))
+    return trees, errors
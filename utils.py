@@ -5,9 +5,9 @@ from typing import Callable, TypeVar, Any, Iterator
 from functools import wraps
 import pathlib
 import contextlib
-from googleapiclient.http import MediaIoBaseDownload
+from instrument import INSTRUMENTS
 
-# __all__ = ['measure_time', 'bytes_to_MB', 'sec_to_hms', 'download_info']
+# __all__ = ['measure_time', 'say', 'bytes_to_MB', 'sec_to_hms']
 
 T = TypeVar("T", bound=Callable[..., Any])
 PathLike = TypeVar("PathLike", str, pathlib.Path, None)
@@ -21,18 +21,29 @@ def measure_time(func: Callable[[T], T]) -> Callable[[T], T]:
     returns -> caller => Callable
 
     -----------------------------------------------------
-    Decorator to measure time.
+    Decorator to measure time. The time goes to the
+    INSTRUMENTS timer named after func, shown in the
+    --instrument summary.
     """
     @wraps(func)
     def caller(*args: T, **kwargs: T) -> T:
-        s_time = time.time()
-        result = func(*args, **kwargs)
-        t_taken = (time.time() - s_time)
-        print(f"{func.__name__} took {t_taken: .2f}s")
-        return result
+        with INSTRUMENTS.timer(func.__qualname__):
+            return func(*args, **kwargs)
     return caller
 
 
+def say(*values: Any) -> None:
+    """
+    print() for the download and planning threads.
+    -----------------------------------------------------
+    args    -> values => Any (joined by spaces, like print)
+
+    -----------------------------------------------------
+    The line and its newline go out in one write, so the
+    lines of concurrent jobs do not run into each other.
+    """
+    print(' '.join(map(str, values)) + '\n', end='', flush=True)
+
 
 def bytes_to_MB(bytes: int) -> float:
     """
@@ -60,43 +71,6 @@ def sec_to_hms(sec: float) -> str:
 
     return str(datetime.timedelta(seconds=int(sec)))
 
-def download_info(status: MediaIoBaseDownload, start_time: float) -> str:
-    """
-    Given status object and a start_time returns current 
-    status of the download.
-    ---------------------------------------------------
-    args    -> status       => status object from MediaIOBasedDownload,
-            -> start_time   => float
-
-    returns -> print_string => str
-
-    ---------------------------------------------------
-    From status object calculates and returns 
-    total_size, total_downloaded, remaining_download, ETA, speed
-    """
-
-    total = bytes_to_MB(status.total_size)
-    remaining = total * (1 - status.progress())
-    curr_time = time.time()
-
-    MB_speed = speed = (total - remaining) / (curr_time - start_time)
-    unit = 'MBps'
-    if speed < 1:
-        speed *= 1024
-        unit = 'KBps'
-    if unit == 'KBps' and speed < 1:
-        speed *= 1024
-        unit = 'Bps'
-
-    ETA = sec_to_hms(remaining / MB_speed)
-    print_string = ', '.join((
-        f" Downloaded: {(total - remaining): .2f} MB / {total: .2f} MB "
-        f"({(total - remaining)/total : .2%})",
-        f"Remaining: {remaining: .2f} MB",
-        f"ETA: {ETA}, speed: {speed: .3f} {unit}                       "
-    ))
-    return print_string
-
 @contextlib.contextmanager
 def chdir(path: PathLike) -> Iterator[None]:
     """A context manager which changes the working directory to the given
@@ -0,0 +1,118 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import FileIO
+from typing import Iterable
+
+from engine import Job
+from global_config import HASH_WORKERS
+from instrument import INSTRUMENTS
+from transfer import pwrite_all
+
+# __all__ = ['md5_file', 'sha256_file', 'HashingFileIO', 'find_identical']
+
+BLOCK = 8 * 2**20
+
+
+def md5_file(path: str, limit: int = None) -> 'hashlib._Hash':
+    """
+    md5 of the first limit bytes of path (all if None).
+    -----------------------------------------------------
+    args    -> path  => str,
+            -> limit => int / None
+
+    returns -> md5   => hashlib md5 object
+    """
+    md5 = hashlib.md5()
+    remaining = limit
+    with open(path, 'rb') as f, INSTRUMENTS.timer('hash.file'):
+        while remaining is None or remaining > 0:
+            block = f.read(BLOCK if remaining is None
+                           else min(BLOCK, remaining))
+            if not block:
+                break
+            md5.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return md5
+
+
+def sha256_file(path: str) -> str:
+    """Hex sha256 of the whole file at path."""
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class HashingFileIO(FileIO):
+    """
+    FileIO that hashes everything written through it.
+    -----------------------------------------------------
+    args    -> name   => str / int (path or file descriptor),
+            -> mode   => str,
+            -> offset => int (bytes already on disk)
+
+    -----------------------------------------------------
+    Opening at a non-zero offset hashes the existing
+    prefix first, so self.md5 always covers the whole
+    file so far. Writes go to self.offset with pwrite_all,
+    in full, so the file may be preallocated beyond it.
+    """
+
+    def __init__(self, name, mode: str = 'wb', offset: int = 0):
+        super().__init__(name, mode)
+        self.md5 = hashlib.md5()
+        self.offset = 0
+        while self.offset < offset:
+            block = os.pread(self.fileno(),
+                             min(BLOCK, offset - self.offset), self.offset)
+            if not block:
+                break
+            self.md5.update(block)
+            self.offset += len(block)
+
+    def write(self, data) -> int:
+        view = memoryview(data)
+        written = pwrite_all(self.fileno(), view, self.offset)
+        with INSTRUMENTS.timer('hash.update'):
+            self.md5.update(view)
+        self.offset += written
+        return written
+
+
+def _identical(job: Job) -> bool:
+    meta = job.meta or {}
+    try:
+        if os.path.getsize(job.path) != int(meta['size']):
+            return False
+    except (OSError, KeyError, TypeError, ValueError):
+        return False
+    return md5_file(job.path).hexdigest() == meta.get('md5Checksum')
+
+
+def find_identical(jobs: Iterable[Job], workers: int = HASH_WORKERS) -> list[Job]:
+    """
+    Jobs whose destination already holds the remote file.
+    -----------------------------------------------------
+    args    -> jobs    => Iterable[Job],
+            -> workers => int (default: HASH_WORKERS)
+
+    returns -> jobs    => list[Job]
+
+    -----------------------------------------------------
+    Only files whose size matches are hashed, on a pool
+    of workers threads, and compared to md5Checksum.
+    """
+    candidates = [
+        job for job in jobs
+        if (job.meta or {}).get('md5Checksum') and os.path.isfile(job.path)
+    ]
+    if not candidates:
+        return []
+    with ThreadPoolExecutor(max(1, workers),
+                            thread_name_prefix='hash') as pool:
+        return [job for job, same in zip(candidates,
+                                         pool.map(_identical, candidates))
+                if same]